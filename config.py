@@ -11,9 +11,11 @@ def get_env_variable(name: str):
         sys.exit(1)
     return value
 
-BOT_TOKEN = get_env_variable("BOT_TOKEN")
+# Несколько ботов в одном процессе: список в tenants.yaml (тогда BOT_TOKEN в .env не нужен)
+TENANTS_FILE = os.getenv("TENANTS_FILE", "tenants.yaml")
+
+BOT_TOKEN = os.getenv("BOT_TOKEN") if os.path.exists(TENANTS_FILE) else get_env_variable("BOT_TOKEN")
 YANDEX_TOKEN = get_env_variable("YANDEX_TOKEN")
-EXCEL_FILE = "subscriptions.xlsx"
 
 # Папка на Яндекс.Диске
 YANDEX_DIR = "/Боты/Бот журнала"
@@ -41,4 +43,37 @@ try:
     group_id_str = os.getenv("ADMIN_GROUP_ID")
     ADMIN_GROUP_ID = int(group_id_str) if group_id_str else None
 except ValueError:
-    ADMIN_GROUP_ID = None
\ No newline at end of file
+    ADMIN_GROUP_ID = None
+
+# Количество процессов-воркеров (1 — обычный режим в одном процессе)
+try:
+    WORKERS = max(1, int(os.getenv("WORKERS", "1")))
+except ValueError:
+    WORKERS = 1
+
+# Общая база состояний FSM и карты переписок для режима воркеров
+STATE_DB = os.getenv("STATE_DB", "bot_state.sqlite3")
+
+# Выгрузка в облако: "full" — весь xlsx на каждую заявку,
+# "segments" — только дневные сегменты + manifest, полный файл по расписанию
+SYNC_MODE = os.getenv("SYNC_MODE", "full").strip().lower()
+SEGMENTS_DIR = os.getenv("SEGMENTS_DIR", "segments")
+try:
+    CONSOLIDATE_HOURS = float(os.getenv("CONSOLIDATE_HOURS", "24"))
+except ValueError:
+    CONSOLIDATE_HOURS = 24.0
+
+# Как часто проверять правки координаторов в облачном subscriptions.xlsx (0 — не проверять)
+try:
+    SYNC_DOWN_MINUTES = float(os.getenv("SYNC_DOWN_MINUTES", "5"))
+except ValueError:
+    SYNC_DOWN_MINUTES = 5.0
+
+# Предохранители внешних сервисов: после стольких ошибок подряд сервис считается недоступным,
+# работа копится в OUTBOX_DB и досылается после успешной пробной попытки (раз в BREAKER_RESET_SECONDS)
+try:
+    BREAKER_FAILURES = max(1, int(os.getenv("BREAKER_FAILURES", "3")))
+    BREAKER_RESET_SECONDS = float(os.getenv("BREAKER_RESET_SECONDS", "60"))
+except ValueError:
+    BREAKER_FAILURES, BREAKER_RESET_SECONDS = 3, 60.0
+OUTBOX_DB = os.getenv("OUTBOX_DB", "outbox.sqlite3")
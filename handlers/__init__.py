@@ -0,0 +1,15 @@
+# handlers/__init__.py
+
+
+def register_routers(dp):
+    """Регистрирует роутеры в нужном порядке (общий для main.py и воркеров)."""
+    from handlers import fsm_engine, common, admin_chat
+
+    # Админский чат (ВАЖНО: До FSM, чтобы перехватывать /send и ответы админов)
+    dp.include_router(admin_chat.router)
+
+    # Если вы не создавали common.py, закомментируйте строку ниже
+    dp.include_router(common.router)
+
+    # Затем регистрируем основной движок FSM (анкета)
+    dp.include_router(fsm_engine.router)
@@ -1,43 +1,64 @@
 import re
-import os
-import openpyxl
+from html import escape
 from aiogram import Router, F, Bot, types
 from aiogram.types import Message, ReplyKeyboardRemove
 from aiogram.filters import Command
-from config import ADMIN_GROUP_ID, EXCEL_FILE
+from config import ADMIN_IDS
+from services.thread_manager import set_last_msg_id, get_msg_owner
+from services.media_relay import gather_album, relay
 
 router = Router()
 
-if ADMIN_GROUP_ID:
-    router.message.filter(F.chat.id == ADMIN_GROUP_ID)
+def is_admin_chat(message: Message, tenant) -> bool:
+    """Группа координаторов у каждого бота своя. Если она не задана — как раньше, без фильтра."""
+    return not tenant.admin_group_id or message.chat.id == tenant.admin_group_id
+
+router.message.filter(is_admin_chat)
+
+def is_coordinator(message: Message, tenant) -> bool:
+    """Личные данные подписчиков: только группа координаторов, а если она не задана — только ADMIN_IDS."""
+    if tenant.admin_group_id: return message.chat.id == tenant.admin_group_id
+    return bool(message.from_user) and message.from_user.id in ADMIN_IDS
 
 # --- НОВОЕ: СТАТИСТИКА ЗАЯВОК ---
 @router.message(Command("stats"))
-async def cmd_admin_stats(message: Message):
-    if not os.path.exists(EXCEL_FILE):
-        await message.reply("📂 Файл с заявками еще не создан (0 заявок).")
-        return
-
+async def cmd_admin_stats(message: Message, tenant):
     try:
-        # Открываем файл только для чтения (data_only=True)
-        wb = openpyxl.load_workbook(EXCEL_FILE, read_only=True)
-        ws = wb.active
-        # Считаем строки. max_row может врать, если есть пустые строки, 
-        # но для наших целей (append) это обычно работает корректно.
-        # Вычитаем 1 (заголовок).
-        count = ws.max_row - 1
-        if count < 0: count = 0
-        
+        # Разбор xlsx идет в отдельном процессе, цикл событий не блокируется
+        count = await tenant.store.count_subscriptions()
+        if count is None:
+            await message.reply("📂 Файл с заявками еще не создан (0 заявок).")
+            return
         await message.reply(
             f"📊 <b>Статистика подписок</b>\n\n"
             f"Всего заявок в базе: <b>{count}</b>\n"
-            f"Файл: <code>{EXCEL_FILE}</code>", 
+            f"Файл: <code>{tenant.store.filename}</code>", 
             parse_mode="HTML"
         )
-        wb.close()
     except Exception as e:
         await message.reply(f"❌ Ошибка чтения файла: {e}")
 
+# --- ПОИСК ПОДПИСЧИКА ---
+@router.message(Command("find"), is_coordinator)
+async def cmd_find(message: Message, tenant):
+    parts = message.text.split(maxsplit=1)
+    if len(parts) < 2:
+        await message.answer("⚠️ Формат: <code>/find ЗАПРОС</code> (ФИО, телефон, @username или ID)", parse_mode="HTML")
+        return
+    try:
+        found = await tenant.store.search_subscribers(parts[1])
+    except Exception as e:
+        await message.reply(f"❌ Ошибка поиска: {e}")
+        return
+    if not found:
+        await message.reply("🔍 Ничего не найдено (нужно хотя бы 3 символа).")
+        return
+    lines = [
+        f"👤 {escape(name)} | 📱 {escape(phone)} | {escape(username)} | <code>{user_id}</code> | {escape(date[:16])}"
+        for date, user_id, username, name, phone in found
+    ]
+    await message.reply("🔍 <b>Найдено:</b>\n\n" + "\n".join(lines), parse_mode="HTML")
+
 # --- СПРАВКА ---
 @router.message(Command("help"))
 async def cmd_admin_help(message: Message):
@@ -49,7 +70,9 @@ async def cmd_admin_help(message: Message):
         "Сделайте <b>Reply</b> на сообщение от бота.\n\n"
         "3. <b>Написать первым:</b>\n"
         "<code>/send ID ТЕКСТ</code>\n\n"
-        "4. <b>Инфо:</b>\n"
+        "4. <b>Поиск подписчика:</b>\n"
+        "<code>/find ФИО / телефон / @username / ID</code>\n\n"
+        "5. <b>Инфо:</b>\n"
         "/id — ID группы."
     )
     await message.answer(text, parse_mode="HTML", reply_markup=ReplyKeyboardRemove())
@@ -59,17 +82,22 @@ async def cmd_admin_help(message: Message):
 async def process_coordinator_reply(message: Message, bot: Bot):
     if not message.reply_to_message.from_user.is_bot: return 
 
-    original_text = message.reply_to_message.text or message.reply_to_message.caption
-    match = re.search(r"ID:\s*<code>(\d+)</code>", original_text)
-    if not match:
-        match = re.search(r"ID:\s*(\d+)", original_text)
+    user_id = get_msg_owner(message.reply_to_message.message_id)
+    if not user_id:
+        original_text = message.reply_to_message.text or message.reply_to_message.caption or ""
+        match = re.search(r"ID:\s*<code>(\d+)</code>", original_text)
+        if not match:
+            match = re.search(r"ID:\s*(\d+)", original_text)
+        if match: user_id = int(match.group(1))
 
-    if match:
-        user_id = int(match.group(1))
+    if user_id:
+        album = None
+        if message.media_group_id:
+            album = await gather_album(message)
+            if album is None: return
         try:
-            from services.thread_manager import set_last_msg_id
-            response_text = f"👩‍💻 <b>Ответ координатора:</b>\n\n{message.text}"
-            sent_msg = await bot.send_message(chat_id=user_id, text=response_text, parse_mode="HTML")
+            # Текст — sendMessage, медиа — copyMessage/sendMediaGroup по file_id
+            await relay(bot, user_id, message, "👩‍💻 <b>Ответ координатора:</b>\n", album=album)
             set_last_msg_id(user_id, message.message_id)
             try: await message.react([types.ReactionTypeEmoji(emoji="👍")])
             except: pass
@@ -90,7 +118,6 @@ async def cmd_send_manual(message: Message, bot: Bot):
     target_id = int(parts[1])
     text = parts[2]
     try:
-        from services.thread_manager import set_last_msg_id
         full_text = f"👩‍💻 <b>Сообщение от координатора:</b>\n\n{text}"
         await bot.send_message(chat_id=target_id, text=full_text, parse_mode="HTML")
         set_last_msg_id(target_id, message.message_id)
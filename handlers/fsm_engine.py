@@ -7,23 +7,41 @@ from aiogram import Router, types, F, Bot
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.filters import Command, StateFilter
+from aiogram.exceptions import (
+    TelegramBadRequest, TelegramNetworkError, TelegramServerError, TelegramRetryAfter, TelegramForbiddenError
+)
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton, FSInputFile
 from datetime import datetime
+from collections import ChainMap
 
-from config import ADMIN_GROUP_ID
-from services.sheets import add_subscription, CloudUploadError, find_last_subscription
-from services.thread_manager import get_last_msg_id, set_last_msg_id
+from services.context import current_tenant
+from services.thread_manager import get_last_msg_id, set_last_msg_id, set_msg_owner
+from services.media_relay import gather_album, gather_burst, flush_burst, relay, copy_with_header, send_text
+from services.payment_qr import get_qr_photo, remember_file_id
+from services import outbox
 
 router = Router()
 logger = logging.getLogger(__name__)
 router.message.filter(F.chat.type == "private")
 
-try:
-    with open("fsm_config.yaml", encoding="utf-8") as f:
-        FSM_CONFIG = yaml.safe_load(f)
-except Exception as e:
-    logger.critical(f"Ошибка чтения fsm_config.yaml: {e}")
-    FSM_CONFIG = {"initial_state": "error", "states": {}}
+# Ошибки, при которых группа координаторов считается недоступной
+# (TelegramBadRequest — ошибка в самом запросе, повторять его бессмысленно)
+ADMIN_OUTAGE = (TelegramNetworkError, TelegramServerError, TelegramRetryAfter, TelegramForbiddenError, asyncio.TimeoutError)
+
+def load_fsm_config(path: str) -> dict:
+    """Читает и компилирует YAML одного бота (вызывается при создании тенанта)."""
+    try:
+        with open(path, encoding="utf-8") as f:
+            config = yaml.safe_load(f)
+    except Exception as e:
+        logger.critical(f"Ошибка чтения {path}: {e}")
+        config = {"initial_state": "error", "states": {}}
+    compile_config(config)
+    return config
+
+def fsm_config() -> dict:
+    """YAML бота, который обрабатывает текущий апдейт."""
+    return current_tenant().fsm_config
 
 class EngineState(StatesGroup):
     active = State()          
@@ -31,7 +49,7 @@ class EngineState(StatesGroup):
     in_dialogue = State()     
 
 def get_node(node_name):
-    return FSM_CONFIG.get("states", {}).get(node_name)
+    return fsm_config().get("states", {}).get(node_name)
 
 def create_kb(buttons_list):
     if not buttons_list: return types.ReplyKeyboardRemove()
@@ -41,111 +59,223 @@ def create_kb(buttons_list):
 async def report_error(message: types.Message, error_text: str):
     logger.error(error_text)
     await message.answer("⚠️ Ошибка. Попробуйте /start.")
-    if ADMIN_GROUP_ID:
-        try: await message.bot.send_message(ADMIN_GROUP_ID, f"🚨 <b>ERROR LOG</b>\n<pre>{error_text}</pre>", parse_mode="HTML")
+    if current_tenant().admin_group_id:
+        try: await send_or_queue(message.bot, {"header": "🚨 <b>ERROR LOG</b>", "text": f"<pre>{error_text}</pre>"})
         except: pass
 
-async def execute_action(action_name, message, state: FSMContext):
-    if not action_name: return None
-    data = await state.get_data()
-    text = message.text
+# --- ОТПРАВКА В ГРУППУ КООРДИНАТОРОВ ---
+# job — JSON-совместимый словарь, чтобы при недоступной группе его можно было отложить в outbox:
+# {"header", "user_id", "reply_to"} и одно из: "copy" (сообщение по id), "text", "messages" (+ "album")
+async def send_admin_job(bot: Bot, job: dict) -> list:
+    group_id = current_tenant().admin_group_id
+    user_id = job.get("user_id")
+    # Отложенное сообщение встает в ту ветку, которая актуальна на момент отправки
+    reply_to = (get_last_msg_id(user_id) if user_id else None) or job.get("reply_to")
+    header = job["header"]
+    if job.get("copy"):
+        c = job["copy"]
+        sent_ids = await copy_with_header(bot, group_id, c["chat_id"], c["message_id"], c["content_type"], header, c.get("caption", ""), reply_to)
+    elif job.get("messages"):
+        messages = [types.Message.model_validate(m) for m in job["messages"]]
+        sent_ids = await relay(bot, group_id, messages[0], header, reply_to, messages if job.get("album") else None)
+    else:
+        sent_ids = await send_text(bot, group_id, header, job["text"], reply_to)
+    if user_id and sent_ids:
+        for msg_id in sent_ids: set_msg_owner(msg_id, user_id)
+        set_last_msg_id(user_id, sent_ids[-1])
+    return sent_ids
 
-    if action_name == "check_paper_history" or action_name == "check_digital_history":
-        is_paper = (action_name == "check_paper_history")
-        sub_type = "Бумажная версия" if is_paper else "Электронная версия"
-        await state.update_data(sub_type=sub_type)
-        user_id = message.from_user.id
+async def send_or_queue(bot: Bot, job: dict):
+    """id отправленных сообщений или None, если группа недоступна и job отложен в outbox."""
+    tenant = current_tenant()
+    # Пока в outbox есть недосланное, новые сообщения встают за ним — порядок не нарушается
+    if tenant.admin_breaker.closed and not outbox.has("admin", tenant.name):
         try:
-            history = await asyncio.to_thread(find_last_subscription, user_id)
-        except Exception as e:
-            return "not_found"
-        if history and history.get("name"):
-            await state.update_data(saved_name=history['name'], saved_phone=history['phone'], saved_address=history.get('address', ''))
-            return sub_type
-        else:
-            return "not_found"
+            sent_ids = await send_admin_job(bot, job)
+            tenant.admin_breaker.success()
+            return sent_ids
+        except ADMIN_OUTAGE as e:
+            tenant.admin_breaker.failure(e)
+    outbox.put("admin", tenant.name, job)
+    return None
 
-    elif action_name == "autofill_paper":
-        await state.update_data(
-            name=data.get("saved_name"),
-            phone=data.get("saved_phone"),
-            delivery_info=f"По почте (+доставка). Адрес: {data.get('saved_address', '')}"
-        )
-    elif action_name == "autofill_digital":
-        await state.update_data(
-            name=data.get("saved_name"),
-            phone=data.get("saved_phone"),
-            delivery_info="Прислать в этот чат"
-        )
-    
-    elif action_name == "save_name":
-        await state.update_data(name=text)
-    elif action_name == "save_delivery_method":
-        await state.update_data(delivery_info=text)
-    elif action_name == "save_address_append":
-        current_info = data.get("delivery_info", "По почте (+доставка)")
-        await state.update_data(delivery_info=f"{current_info}. Адрес: {text}")
-    elif action_name == "save_digital_delivery":
-        await state.update_data(delivery_info=text)
-    elif action_name == "save_phone":
-        await state.update_data(phone=text)
-    elif action_name == "save_issues":
-        await state.update_data(issues=text)
-
-    # --- ИСПРАВЛЕНИЕ ЗДЕСЬ ---
-    elif action_name == "clear_data":
-        # Получаем текущие данные
-        current_data = await state.get_data()
-        # Собираем данные, которые нужно СОХРАНИТЬ (цены)
-        data_to_keep = {
-            key: value for key, value in current_data.items() if key.startswith('price_')
-        }
-        # Очищаем все и тут же восстанавливаем цены
-        await state.clear()
-        await state.set_data(data_to_keep)
-    # -------------------------
-
-    elif action_name == "prepare_payment_and_calc":
-        await state.update_data(consent="Да")
-        config_prices = FSM_CONFIG.get("config", {}).get("prices")
-        if not config_prices:
-            await state.update_data(price_text="Ошибка цен")
-            return
+async def deliver_queued(tenant, job: dict):
+    """Задание outbox. Недоступность группы пробрасываем (задание повторится), ошибку запроса — в лог."""
+    try:
+        await send_admin_job(tenant.bot, job)
+    except ADMIN_OUTAGE:
+        raise
+    except Exception as e:
+        logger.error(f"Отложенное сообщение в группу не доставлено: {e}\n{job}")
 
-        sub_type = data.get("sub_type", "")
-        issues = data.get("issues", "")
-        delivery_info = data.get("delivery_info", "").lower()
-        needs_delivery = "+доставка" in delivery_info
-        
-        try:
-            if "электронные" in sub_type.lower():
-                price_str = f"{config_prices['digital']}₽"
-            else:
-                if "комплект" in issues.lower():
-                    base, dele = config_prices["paper_full"], config_prices["delivery_full"] if needs_delivery else 0
-                else:
-                    base, dele = config_prices["paper_single"], config_prices["delivery_single"] if needs_delivery else 0
-                total = base + dele
-                desc = f"({base}₽ + {dele}₽ дост.)" if needs_delivery else "(без доставки)"
-                price_str = f"{total}₽ {desc}"
-            await state.update_data(price_text=price_str)
-        except:
-            await state.update_data(price_text="Ошибка цен")
-
-    elif action_name == "submit_subscription":
-        wait_msg = await message.answer("⏳ Сохраняем...")
-        row = [
-            datetime.now().strftime("%Y-%m-%d %H:%M"), message.from_user.id, f"@{message.from_user.username or 'unknown'}",
-            data.get("sub_type"), data.get("name"), data.get("delivery_info"), 
-            data.get("phone"), data.get("issues"), data.get("consent")
-        ]
-        try:
-            await add_subscription(row)
-            await wait_msg.delete()
-        except Exception as e:
-            await wait_msg.edit_text(f"⚠️ Ошибка: {e}")
+# --- РЕЕСТР ДЕЙСТВИЙ ---
+# {имя действия: async def handler(name, message, state)}. Данные FSM читает только тот, кому они нужны.
+ACTIONS = {}
+
+def action(*names):
+    def decorator(func):
+        for name in names: ACTIONS[name] = func
+        return func
+    return decorator
+
+def compile_action(spec: dict):
+    """Собирает обработчик из YAML-формы:
+    {set: phone} — сохранить текст сообщения в ключ;
+    {append: delivery_info, prefix: "Адрес: ", sep: ". ", default: "..."} — дописать к значению ключа."""
+    if "set" in spec:
+        key = spec["set"]
+        async def set_handler(name, message, state: FSMContext):
+            await state.update_data({key: message.text})
+        return set_handler
+    if "append" in spec:
+        key, prefix = spec["append"], spec.get("prefix", "")
+        sep, default = spec.get("sep", ". "), spec.get("default", "")
+        async def append_handler(name, message, state: FSMContext):
+            current = (await state.get_data()).get(key, default)
+            value = f"{prefix}{message.text}"
+            await state.update_data({key: f"{current}{sep}{value}" if current else value})
+        return append_handler
+    raise ValueError(f"Неизвестная форма действия: {spec}")
+
+# Старые имена из YAML — те же простые формы
+ACTIONS.update({
+    "save_name": compile_action({"set": "name"}),
+    "save_phone": compile_action({"set": "phone"}),
+    "save_issues": compile_action({"set": "issues"}),
+    "save_delivery_method": compile_action({"set": "delivery_info"}),
+    "save_digital_delivery": compile_action({"set": "delivery_info"}),
+    "save_address_append": compile_action({"append": "delivery_info", "prefix": "Адрес: ", "default": "По почте (+доставка)"}),
+})
+
+async def execute_action(action_spec, message, state: FSMContext):
+    if not action_spec: return None
+    # Словарные действия собраны при загрузке в функции, строковые ищем в реестре
+    handler = action_spec if callable(action_spec) else ACTIONS.get(action_spec)
+    if not handler:
+        logger.warning(f"Неизвестное действие: {action_spec}")
+        return None
+    return await handler(action_spec, message, state)
+
+@action("check_paper_history", "check_digital_history")
+async def check_history(action_name, message, state: FSMContext):
+    is_paper = (action_name == "check_paper_history")
+    sub_type = "Бумажная версия" if is_paper else "Электронная версия"
+    await state.update_data(sub_type=sub_type)
+    user_id = message.from_user.id
+    try:
+        history = await current_tenant().store.find_last_subscription(user_id)
+    except Exception as e:
+        return "not_found"
+    if history and history.get("name"):
+        await state.update_data(saved_name=history['name'], saved_phone=history['phone'], saved_address=history.get('address', ''))
+        return sub_type
+    else:
+        return "not_found"
+
+@action("autofill_paper")
+async def autofill_paper(action_name, message, state: FSMContext):
+    data = await state.get_data()
+    await state.update_data(
+        name=data.get("saved_name"),
+        phone=data.get("saved_phone"),
+        delivery_info=f"По почте (+доставка). Адрес: {data.get('saved_address', '')}"
+    )
+
+@action("autofill_digital")
+async def autofill_digital(action_name, message, state: FSMContext):
+    data = await state.get_data()
+    await state.update_data(
+        name=data.get("saved_name"),
+        phone=data.get("saved_phone"),
+        delivery_info="Прислать в этот чат"
+    )
+
+@action("clear_data")
+async def clear_data(action_name, message, state: FSMContext):
+    # Цены в состоянии не хранятся (см. build_global_context), сохранять нечего
+    await state.clear()
+
+@action("prepare_payment_and_calc")
+async def prepare_payment_and_calc(action_name, message, state: FSMContext):
+    await state.update_data(consent="Да")
+    config_prices = fsm_config().get("config", {}).get("prices")
+    if not config_prices:
+        await state.update_data(price_text="Ошибка цен", price_total=None)
+        return
+
+    data = await state.get_data()
+    sub_type = data.get("sub_type", "")
+    issues = data.get("issues", "")
+    delivery_info = data.get("delivery_info", "").lower()
+    needs_delivery = "+доставка" in delivery_info
     
-    return None
+    try:
+        if "электрон" in sub_type.lower():
+            total = config_prices['digital']
+            price_str = f"{total}₽"
+        else:
+            if "комплект" in issues.lower():
+                base, dele = config_prices["paper_full"], config_prices["delivery_full"] if needs_delivery else 0
+            else:
+                base, dele = config_prices["paper_single"], config_prices["delivery_single"] if needs_delivery else 0
+            total = base + dele
+            desc = f"({base}₽ + {dele}₽ дост.)" if needs_delivery else "(без доставки)"
+            price_str = f"{total}₽ {desc}"
+        # Сумма числом — для QR-кода с полем Sum
+        await state.update_data(price_text=price_str, price_total=total)
+    except:
+        await state.update_data(price_text="Ошибка цен", price_total=None)
+
+@action("submit_subscription")
+async def submit_subscription(action_name, message, state: FSMContext):
+    data = await state.get_data()
+    wait_msg = await message.answer("⏳ Сохраняем...")
+    row = [
+        datetime.now().strftime("%Y-%m-%d %H:%M"), message.from_user.id, f"@{message.from_user.username or 'unknown'}",
+        data.get("sub_type"), data.get("name"), data.get("delivery_info"), 
+        data.get("phone"), data.get("issues"), data.get("consent")
+    ]
+    try:
+        await current_tenant().store.add_subscription(row)
+        await wait_msg.delete()
+    except Exception as e:
+        await wait_msg.edit_text(f"⚠️ Ошибка: {e}")
+
+def compile_config(config: dict):
+    """Один раз при загрузке: словарные действия -> функции, проверка имен."""
+    for node_name, node in config.get("states", {}).items():
+        for trans in node.get("transitions", []):
+            spec = trans.get("action")
+            if isinstance(spec, dict):
+                try: trans["action"] = compile_action(spec)
+                except ValueError as e: logger.critical(f"{node_name}: {e}")
+            elif spec and spec not in ACTIONS:
+                logger.critical(f"{node_name}: неизвестное действие '{spec}'")
+
+def build_global_context(config: dict) -> dict:
+    """Значения для шаблонов, общие для всех пользователей (цены из config.prices).
+    В FSM-хранилище лежит только то, что ввел сам пользователь."""
+    prices = config.get("config", {}).get("prices", {}) or {}
+    return {f"price_{key}": value for key, value in prices.items()}
+
+def format_node_text(node, data):
+    text = node.get("text", "")
+    try:
+        # Сначала общие значения из конфига, затем данные пользователя
+        return text.format_map(ChainMap(current_tenant().global_context, data))
+    except KeyError as e:
+        logger.warning(f"Ошибка форматирования текста: не найдена переменная {e}")
+        return text
+
+def create_inline_kb(node_name, node):
+    """Для узлов с inline: true — те же кнопки, но inline. В callback_data номер перехода,
+    а не текст кнопки: текст с эмодзи может не влезть в 64 байта."""
+    index = {t.get("trigger"): i for i, t in enumerate(node.get("transitions", []))}
+    kb = [
+        [InlineKeyboardButton(text=b, callback_data=f"nav:{node_name}:{index[b]}") for b in row if b in index]
+        for row in node.get("keyboard", [])
+    ]
+    return InlineKeyboardMarkup(inline_keyboard=[row for row in kb if row])
 
 async def render_state(node_name, message, state: FSMContext):
     node = get_node(node_name)
@@ -154,80 +284,125 @@ async def render_state(node_name, message, state: FSMContext):
         return
 
     data = await state.get_data()
-    text = node.get("text", "")
-    
-    try:
-        text = text.format(**data)
-    except KeyError as e:
-        logger.warning(f"Ошибка форматирования текста: не найдена переменная {e}")
-        pass
+    text = format_node_text(node, data)
     
-    kb = create_kb(node.get("keyboard", []))
+    kb = create_inline_kb(node_name, node) if node.get("inline") else create_kb(node.get("keyboard", []))
+    node_data = {"current_node": node_name}
+    # Узел, чья reply-клавиатура сейчас видна пользователю (inline-узлы ее не меняют)
+    if not node.get("inline"): node_data["reply_node"] = node_name
     image_file = node.get("image")
+
+    if node.get("payment_qr") and data.get("price_total"):
+        try:
+            details = fsm_config().get("config", {}).get("payment", {})
+            purpose = details.get("purpose", "Пожертвование").format(user_id=message.chat.id)
+            photo, qr_key = await get_qr_photo(message.bot.id, details, data["price_total"], purpose)
+            sent = await message.answer_photo(photo=photo, caption=text, reply_markup=kb, parse_mode="HTML")
+            remember_file_id(qr_key, sent)
+            await state.update_data(**node_data)
+            return
+        except Exception as e:
+            logger.warning(f"QR-код не отправлен, используем статичный: {e}")
     
     if image_file:
         if os.path.exists(image_file):
             try:
                 photo = FSInputFile(image_file)
                 await message.answer_photo(photo=photo, caption=text, reply_markup=kb, parse_mode="HTML")
-                await state.update_data(current_node=node_name)
+                await state.update_data(**node_data)
                 return
             except: pass
     
     await message.answer(text, reply_markup=kb, parse_mode="HTML", disable_web_page_preview=True)
-    await state.update_data(current_node=node_name)
+    await state.update_data(**node_data)
 
-async def forward_to_admins(message: types.Message, state: FSMContext, is_reply=False, text_override=None):
-    user = message.from_user
+async def forward_to_admins(message: types.Message, state: FSMContext, is_reply=False, text_override=None, user=None, pending=None):
+    user = user or message.from_user
     username = f"@{user.username}" if user.username else ""
     data = await state.get_data()
     current_node = data.get("current_node", "unknown")
-    content_text = text_override if text_override else (message.text or '[Медиафайл]')
     reply_to_id = get_last_msg_id(user.id) or data.get("last_admin_thread_id")
     header = "🗣 <b>Сообщение</b>" if is_reply else "📩 <b>Новое обращение</b>"
-    
-    admin_text = (
+
+    album = None
+    if not text_override and not pending and message.media_group_id:
+        album = await gather_album(message)
+        # Эта часть альбома уйдет вместе с первой
+        if album is None: return None
+
+    admin_header = (
         f"{header}\n"
         f"👤 {user.full_name} ({username})\n"
         f"🆔 ID: <code>{user.id}</code>\n"
         f"📍 Этап: {current_node}\n"
         f"#id{user.id}\n"
-        f"➖➖➖➖➖➖➖\n"
-        f"{content_text}"
+        f"➖➖➖➖➖➖➖"
     )
 
-    if ADMIN_GROUP_ID:
-        try:
-            sent_msg = await message.bot.send_message(chat_id=ADMIN_GROUP_ID, text=admin_text, parse_mode="HTML", reply_to_message_id=reply_to_id)
-            set_last_msg_id(user.id, sent_msg.message_id)
-            await state.update_data(last_admin_thread_id=sent_msg.message_id)
-            return True
-        except: return False
-    return False
-
-async def load_prices_to_state(state: FSMContext):
-    prices = FSM_CONFIG.get("config", {}).get("prices", {})
-    price_data = {
-        'price_digital': prices.get('digital', 0),
-        'price_paper_single': prices.get('paper_single', 0),
-        'price_paper_full': prices.get('paper_full', 0),
-        'price_delivery_single': prices.get('delivery_single', 0),
-        'price_delivery_full': prices.get('delivery_full', 0)
-    }
-    await state.update_data(**price_data)
+    if not current_tenant().admin_group_id: return False
+    job = {"header": admin_header, "user_id": user.id, "reply_to": reply_to_id}
+    if pending and pending.get("messages"):
+        # Отложенный альбом из confirm_forward: одной группой, по file_id
+        job.update(pending)
+    elif pending:
+        # Отложенное медиа из confirm_forward: копируем по id, без скачивания
+        job["copy"] = pending
+    elif text_override:
+        job["text"] = text_override
+    else:
+        job["messages"] = [m.model_dump(mode="json", by_alias=True, exclude_none=True) for m in album or [message]]
+        job["album"] = bool(album)
+    try:
+        sent_ids = await send_or_queue(message.bot, job)
+    except: return False
+    # Группа недоступна: сообщение дошлет outbox, пользователь ответ получает сразу
+    if sent_ids is None: return True
+    if not sent_ids: return False
+    await state.update_data(last_admin_thread_id=sent_ids[-1])
+    return True
+
+async def relay_dialogue(batch: list, state: FSMContext):
+    """Сообщения диалога -> координаторам. Одна реакция на всю серию — на последнее сообщение."""
+    message = batch[-1]
+    if len(batch) > 1:
+        success = await forward_to_admins(message, state, is_reply=True, text_override="\n".join(m.html_text for m in batch))
+    else:
+        success = await forward_to_admins(message, state, is_reply=True)
+    if success is None: return
+    if success:
+        try: await message.react([types.ReactionTypeEmoji(emoji="👀")])
+        except: pass
+    else: await message.answer("⚠️ Ошибка связи.")
+
+async def resolve_transition(target_node, action_to_do, message, state: FSMContext):
+    """Действие перехода и автопереход: если действие вернуло триггер следующего узла,
+    сразу идем дальше. Возвращает узел для показа или None (ошибка уже показана)."""
+    action_result = await execute_action(action_to_do, message, state)
+    next_node_data = get_node(target_node)
+    if not next_node_data:
+        await report_error(message, f"Node '{target_node}' not found")
+        return None
+    if action_result:
+        for t in next_node_data.get("transitions", []):
+            if t.get("trigger") == action_result:
+                final_node = t.get("dest")
+                if not get_node(final_node):
+                    await report_error(message, f"Final node '{final_node}' not found")
+                    return None
+                await execute_action(t.get("action"), message, state)
+                return final_node
+    return target_node
 
 @router.message(Command("start"))
 async def cmd_start(message: types.Message, state: FSMContext):
     await state.clear()
-    await load_prices_to_state(state)
-    start_node = FSM_CONFIG.get("initial_state", "main_menu")
+    start_node = fsm_config().get("initial_state", "main_menu")
     await render_state(start_node, message, state)
     await state.set_state(EngineState.active)
 
 @router.message(StateFilter(None))
 async def catch_stateless_message(message: types.Message, state: FSMContext):
-    await load_prices_to_state(state)
-    start_node_name = FSM_CONFIG.get("initial_state", "main_menu")
+    start_node_name = fsm_config().get("initial_state", "main_menu")
     start_node = get_node(start_node_name)
     if not start_node: await cmd_start(message, state); return
     user_text = message.text
@@ -250,6 +425,10 @@ async def process_step(message: types.Message, state: FSMContext):
 
     user_text = message.text
     transitions = node.get("transitions", [])
+    if node.get("inline"):
+        # Под inline-сообщением осталась клавиатура предыдущего узла — ее кнопки тоже работают
+        reply_node = get_node(data.get("reply_node"))
+        if reply_node: transitions = transitions + reply_node.get("transitions", [])
     target_node = None
     action_to_do = None
 
@@ -261,27 +440,9 @@ async def process_step(message: types.Message, state: FSMContext):
             
     if target_node:
         try:
-            action_result = await execute_action(action_to_do, message, state)
-            next_node_data = get_node(target_node)
-            auto_transition = None
-            if not next_node_data:
-                await report_error(message, f"Node '{target_node}' not found")
-                return
-            if action_result:
-                for t in next_node_data.get("transitions", []):
-                    if t.get("trigger") == action_result:
-                        auto_transition = t
-                        break
-            if auto_transition:
-                final_node = auto_transition.get("dest")
-                final_action = auto_transition.get("action")
-                if not get_node(final_node):
-                    await report_error(message, f"Final node '{final_node}' not found")
-                    return
-                await execute_action(final_action, message, state)
-                await render_state(final_node, message, state)
-            else:
-                await render_state(target_node, message, state)
+            final_node = await resolve_transition(target_node, action_to_do, message, state)
+            if not final_node: return
+            await render_state(final_node, message, state)
             if current_state == EngineState.in_dialogue: 
                 await state.set_state(EngineState.active)
             return
@@ -291,11 +452,16 @@ async def process_step(message: types.Message, state: FSMContext):
             return
 
     if current_state == EngineState.in_dialogue:
-        success = await forward_to_admins(message, state, is_reply=True)
-        if success:
-            try: await message.react([types.ReactionTypeEmoji(emoji="👀")])
-            except: pass
-        else: await message.answer("⚠️ Ошибка связи.")
+        dialogue_cfg = fsm_config().get("config", {}).get("dialogue", {}) or {}
+        window = dialogue_cfg.get("batch_seconds", 1.5)
+        key = (message.bot.id, message.from_user.id)
+        if message.text and window:
+            # Серия коротких сообщений уходит координаторам одним сообщением с одним заголовком
+            await gather_burst(key, message, window, lambda batch: relay_dialogue(batch, state), dialogue_cfg.get("batch_max", 10))
+        else:
+            # Медиа уходит после текста, набранного раньше
+            await flush_burst(key)
+            await relay_dialogue([message], state)
         return
 
     for trans in transitions:
@@ -309,7 +475,7 @@ async def process_step(message: types.Message, state: FSMContext):
         return
 
     is_navigation_button = False
-    for s_name, s_data in FSM_CONFIG["states"].items():
+    for s_name, s_data in fsm_config()["states"].items():
         for t in s_data.get("transitions", []):
             if t.get("trigger") == user_text: is_navigation_button = True; break
         if is_navigation_button: break
@@ -317,7 +483,19 @@ async def process_step(message: types.Message, state: FSMContext):
         await render_state(current_node_name, message, state)
         return
 
-    await state.update_data(pending_message_text=message.text)
+    pending_media = None
+    if message.media_group_id:
+        # Один вопрос на весь альбом; координаторам он уйдет одной группой
+        album = await gather_album(message)
+        if album is None: return
+        pending_media = {"messages": [m.model_dump(mode="json", by_alias=True, exclude_none=True) for m in album], "album": True}
+    elif not message.text:
+        pending_media = {
+            "chat_id": message.chat.id, "message_id": message.message_id,
+            "content_type": getattr(message.content_type, "value", message.content_type),
+            "caption": message.html_text if message.caption else "",
+        }
+    await state.update_data(pending_message_text=message.text, pending_media=pending_media)
     confirm_kb = InlineKeyboardMarkup(inline_keyboard=[[InlineKeyboardButton(text="📨 Отправить координатору", callback_data="fwd_yes"), InlineKeyboardButton(text="❌ Это ошибка", callback_data="fwd_no")]])
     await message.answer("Я не понял эту команду. 🤔\nХотите отправить это сообщение координатору?", reply_markup=confirm_kb)
     await state.set_state(EngineState.confirm_forward)
@@ -333,7 +511,73 @@ async def process_forward_decision(callback: types.CallbackQuery, state: FSMCont
         data = await state.get_data()
         saved_text = data.get("pending_message_text", "")
         await state.set_state(EngineState.in_dialogue)
-        success = await forward_to_admins(message=callback.message, state=state, is_reply=False, text_override=saved_text)
+        success = await forward_to_admins(
+            message=callback.message, state=state, is_reply=False, text_override=saved_text,
+            user=callback.from_user, pending=data.get("pending_media")
+        )
         if success: await callback.message.edit_text("✅ Сообщение передано. Режим диалога включен: пишите сюда, я всё передам.")
         else: await callback.message.edit_text("⚠️ Ошибка: нет группы координаторов.")
-    await callback.answer()
\ No newline at end of file
+    await callback.answer()
+
+@router.callback_query(F.data.startswith("nav:"))
+async def process_inline_nav(callback: types.CallbackQuery, state: FSMContext):
+    """Навигация по информационным узлам (inline: true): то же сообщение редактируется,
+    новое отправляется, только если редактировать нельзя или следующий узел обычный."""
+    notice = None
+    try:
+        notice = await inline_nav(callback, state)
+    finally:
+        # Кнопка не должна «крутиться», что бы ни случилось выше
+        try: await callback.answer(notice)
+        except TelegramBadRequest: pass
+
+async def inline_nav(callback: types.CallbackQuery, state: FSMContext):
+    """Возвращает текст всплывающего уведомления или None."""
+    try:
+        _, node_name, idx = callback.data.split(":")
+        trans = get_node(node_name)["transitions"][int(idx)]
+    except Exception:
+        return None
+
+    target = trans.get("dest")
+    target_node = get_node(target)
+    if not target_node or not callback.message:
+        return "⚠️ Раздел не найден."
+
+    # callback.message — сообщение самого бота: действию нужен пользователь и нажатая кнопка,
+    # как при переходе по обычной кнопке. Сообщения старше 48 часов приходят как InaccessibleMessage
+    # (без текста и методов правки) — тогда отвечаем обычным сообщением в тот же чат
+    editable = isinstance(callback.message, types.Message)
+    update = {"from_user": callback.from_user, "text": trans.get("trigger")}
+    if editable:
+        message = callback.message.model_copy(update=update)
+    else:
+        message = types.Message(
+            message_id=callback.message.message_id, date=datetime.now(), chat=callback.message.chat, **update
+        ).as_(callback.bot)
+    try:
+        target = await resolve_transition(target, trans.get("action"), message, state)
+    except Exception as e:
+        await report_error(message, f"{e}\n\n{traceback.format_exc()}")
+        target = None
+    if not target: return None
+    target_node = get_node(target)
+    await state.set_state(EngineState.active)
+
+    if editable and target_node.get("inline") and not target_node.get("image"):
+        data = await state.get_data()
+        try:
+            await callback.message.edit_text(
+                format_node_text(target_node, data), reply_markup=create_inline_kb(target, target_node),
+                parse_mode="HTML", disable_web_page_preview=True
+            )
+            await state.update_data(current_node=target)
+            return None
+        except TelegramBadRequest as e:
+            if "message is not modified" in str(e):
+                await state.update_data(current_node=target)
+                return None
+            # Это фото и т.п. — отправим новое
+
+    await render_state(target, message, state)
+    return None
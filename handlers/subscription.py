@@ -7,7 +7,7 @@ from aiogram.fsm.state import State, StatesGroup
 from datetime import datetime
 
 # Импортируем наши сервисы и кнопки
-from services.sheets import add_subscription
+from services.context import current_tenant
 from keyboards import main_kb, confirm_kb
 
 router = Router()
@@ -122,7 +122,7 @@ async def submit_form(message: Message, state: FSMContext):
     
     try:
         # 2. Пытаемся сохранить (если файл занят, бот тут "повисит" и подождет)
-        await add_subscription(row)
+        await current_tenant().store.add_subscription(row)
         
         # 3. Если всё ок — редактируем сообщение
         await status_msg.edit_text(
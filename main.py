@@ -7,16 +7,22 @@ import logging
 print("⏳ Загрузка библиотек и конфигурации...", end=" ", flush=True)
 
 from aiogram import Bot, Dispatcher
+from aiogram.client.session.aiohttp import AiohttpSession
 from aiogram.exceptions import TelegramUnauthorizedError
 import yadisk
 
 # Импорт конфигурации
-from config import BOT_TOKEN, YANDEX_TOKEN, ADMIN_IDS
+from config import YANDEX_TOKEN, ADMIN_IDS, WORKERS, SYNC_MODE, SYNC_DOWN_MINUTES
 
 # Импорт обработчиков
 # fsm_engine - наш новый движок с YAML
 # common - технические команды типа /id (если файла нет, удалите эту строку)
-from handlers import fsm_engine, common, admin_chat
+from handlers import fsm_engine, common, admin_chat, register_routers
+from services.cluster import run_cluster
+from services.pool import start_pool
+from services.tenants import load_tenants, TenantMiddleware
+from services import outbox
+from services.sheets import cloud_breaker
 
 print("✅ Готово.")
 
@@ -57,36 +63,74 @@ async def main():
             logger.critical("❌ Токен Яндекс.Диска недействителен (просрочен или отозван).")
             sys.exit(1)
             
-    except asyncio.TimeoutError:
-        logger.critical("❌ Таймаут соединения с Яндексом. Проверьте интернет или VPN.")
-        sys.exit(1)
+    except asyncio.TimeoutError as e:
+        # Бот работает и без облака: заявки пишутся локально, выгрузку дошлет outbox
+        logger.warning("⚠️ Таймаут соединения с Яндексом. Работаем без облака до его восстановления.")
+        cloud_breaker.trip(e)
     except Exception as e:
-        logger.critical(f"❌ Ошибка подключения к Яндексу: {e}")
+        logger.warning(f"⚠️ Ошибка подключения к Яндексу: {e}. Работаем без облака до его восстановления.")
+        cloud_breaker.trip(e)
+
+    # Боты: один из .env или несколько из tenants.yaml
+    tenants = load_tenants()
+    if not tenants:
+        logger.critical("❌ В tenants.yaml не описано ни одного бота.")
         sys.exit(1)
+    if WORKERS > 1 and len(tenants) > 1:
+        logger.critical("❌ Режим воркеров (WORKERS > 1) поддерживает только одного бота.")
+        sys.exit(1)
+
+    # Прогреваем процесс для работы с xlsx (openpyxl не должен тормозить цикл событий)
+    await start_pool()
+    background_tasks = []
+    for tenant in tenants:
+        if SYNC_MODE == "segments":
+            # Полная книга уходит в облако по расписанию, на заявку — только сегменты
+            background_tasks.append(asyncio.create_task(tenant.store.run_consolidation()))
+        if SYNC_DOWN_MINUTES > 0:
+            # Правки координаторов из облака вливаются в локальный файл до следующей выгрузки
+            background_tasks.append(asyncio.create_task(tenant.store.run_sync_down()))
+    # Досылка выгрузок, отложенных пока Яндекс.Диск был недоступен (в том числе до перезапуска)
+    by_name = {tenant.name: tenant for tenant in tenants}
+    background_tasks.append(asyncio.create_task(
+        outbox.drain("upload", by_name, lambda tenant: cloud_breaker, lambda tenant, job: tenant.store.push_to_cloud())
+    ))
 
-    # 4. Инициализация Телеграм-бота
+    # 4. Инициализация Телеграм-ботов
     logger.info("📡 Подключение к Telegram...")
     try:
-        bot = Bot(token=BOT_TOKEN)
-        dp = Dispatcher()
-        
-        # --- РЕГИСТРАЦИЯ РОУТЕРОВ ---
-        
-        # Админский чат (ВАЖНО: До FSM, чтобы перехватывать /send и ответы админов)
-        dp.include_router(admin_chat.router)
-        
-        # Если вы не создавали common.py, закомментируйте строку ниже
-        dp.include_router(common.router)
+        # Одна HTTP-сессия на всех ботов
+        session = AiohttpSession()
+        bots, by_bot_id = [], {}
+        for tenant in tenants:
+            bot = Bot(token=tenant.bot_token, session=session)
+            # Проверка авторизации бота
+            bot_info = await bot.get_me()
+            logger.info(f"✅ Бот [{tenant.name}] авторизован: @{bot_info.username} (ID: {bot_info.id})")
+            bots.append(bot)
+            by_bot_id[bot.id] = tenant
+            tenant.bot = bot
+
+        if WORKERS > 1:
+            # Приемник раздает апдейты воркерам по user_id и сам пишет xlsx
+            logger.info(f"🟢 Режим воркеров: {WORKERS} процессов (Polling в приемнике)...")
+            await bots[0].delete_webhook(drop_pending_updates=True)
+            await run_cluster(bots[0], WORKERS, tenants[0])
+            return
 
+        # Досылка сообщений координаторам, отложенных пока группа была недоступна
+        background_tasks.append(asyncio.create_task(
+            outbox.drain("admin", by_name, lambda tenant: tenant.admin_breaker, fsm_engine.deliver_queued)
+        ))
+
+        dp = Dispatcher()
+        # Каждый апдейт получает своего тенанта (fsm_config, группа, файл заявок)
+        dp.update.outer_middleware(TenantMiddleware(by_bot_id))
 
-        # Затем регистрируем основной движок FSM (анкета)
-        dp.include_router(fsm_engine.router)
+        # --- РЕГИСТРАЦИЯ РОУТЕРОВ ---
+        register_routers(dp)
         # ---------------------------
 
-        # Проверка авторизации бота
-        bot_info = await bot.get_me()
-        logger.info(f"✅ Бот авторизован: @{bot_info.username} (ID: {bot_info.id})")
-        
         # Информация об админах
         if not ADMIN_IDS:
             logger.warning("⚠️ Список админов пуст! Команды администратора недоступны.")
@@ -94,14 +138,15 @@ async def main():
         else:
             logger.info(f"👮 Загружено администраторов: {len(ADMIN_IDS)}")
 
-        logger.info("🟢 Бот запущен и ждет сообщений (Polling)...")
-        
+        logger.info(f"🟢 Запущено ботов: {len(bots)}, ждем сообщений (Polling)...")
+
         # Удаляем вебхуки (если вдруг были) и запускаем прослушку
-        await bot.delete_webhook(drop_pending_updates=True)
-        await dp.start_polling(bot)
+        for bot in bots:
+            await bot.delete_webhook(drop_pending_updates=True)
+        await dp.start_polling(*bots)
 
     except TelegramUnauthorizedError:
-        logger.critical("❌ Ошибка авторизации Telegram. Проверьте BOT_TOKEN в файле .env")
+        logger.critical("❌ Ошибка авторизации Telegram. Проверьте BOT_TOKEN в файле .env или tenants.yaml")
         sys.exit(1)
     except Exception as e:
         logger.critical(f"❌ Критическая ошибка при запуске: {e}", exc_info=True)
@@ -0,0 +1,53 @@
+# services/breaker.py
+# Предохранитель для внешних сервисов (Яндекс.Диск, группа координаторов).
+# После FAILURES ошибок подряд размыкается: вызовы не делаются вовсе, работа уходит
+# в outbox. Через RESET_SECONDS разбор outbox делает одну пробную попытку (half-open):
+# успех замыкает предохранитель, ошибка размыкает его снова.
+import time
+import logging
+
+from config import BREAKER_FAILURES, BREAKER_RESET_SECONDS
+
+logger = logging.getLogger(__name__)
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half-open"
+
+class CircuitBreaker:
+    def __init__(self, name: str, failures: int = BREAKER_FAILURES, reset_seconds: float = BREAKER_RESET_SECONDS):
+        self.name = name
+        self.max_failures = failures
+        self.reset_seconds = reset_seconds
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+
+    @property
+    def closed(self) -> bool:
+        """Можно звать сервис прямо из обработчика (пользователь ждет ответа)."""
+        return self.state == CLOSED
+
+    def ready(self) -> bool:
+        """Можно ли разбирать outbox: замкнут или пора сделать пробную попытку."""
+        if self.state == OPEN and time.monotonic() - self.opened_at >= self.reset_seconds:
+            self.state = HALF_OPEN
+            logger.info(f"🟡 {self.name}: пробная попытка")
+        return self.state != OPEN
+
+    def success(self):
+        if self.state != CLOSED:
+            logger.info(f"🟢 {self.name}: связь восстановлена")
+        self.state = CLOSED
+        self.failures = 0
+
+    def failure(self, error=None):
+        self.failures += 1
+        if self.state == HALF_OPEN or self.failures >= self.max_failures:
+            if self.state != OPEN:
+                logger.warning(f"🔴 {self.name}: нет связи ({error}), работа копится в outbox")
+            self.state = OPEN
+            self.opened_at = time.monotonic()
+
+    def trip(self, error=None):
+        """Разомкнуть сразу (например, сервис недоступен уже при старте)."""
+        self.failures = self.max_failures - 1
+        self.failure(error)
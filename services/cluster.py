@@ -0,0 +1,125 @@
+# services/cluster.py
+# Режим нескольких процессов: один приемник (Polling) раздает апдейты N воркерам по user_id.
+# Состояния FSM и карта переписок — в общей SQLite-базе (STATE_DB),
+# xlsx и выгрузку в облако ведет только приемник (единственный писатель).
+import sys
+import asyncio
+import logging
+import multiprocessing
+
+from config import STATE_DB
+
+logger = logging.getLogger(__name__)
+
+def _shard(update, workers: int) -> int:
+    """Все апдейты одного пользователя попадают в один воркер (важно для альбомов и порядка)."""
+    try:
+        event = update.event
+        user = getattr(event, "from_user", None)
+        chat = getattr(event, "chat", None) or getattr(getattr(event, "message", None), "chat", None)
+        key = user.id if user else (chat.id if chat else update.update_id)
+    except Exception:
+        key = update.update_id
+    return abs(key) % workers
+
+def _worker_main(index: int, updates_q, rows_q, ack_q):
+    logging.basicConfig(
+        level=logging.INFO,
+        format=f"%(asctime)s - worker{index} - %(levelname)s - %(message)s",
+        datefmt="%Y-%m-%d %H:%M:%S",
+        filename=f"bot_log_worker{index}.log",
+        filemode="a",
+        encoding="utf-8"
+    )
+    if sys.platform == 'win32':
+        asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+    try:
+        asyncio.run(_worker(index, updates_q, rows_q, ack_q))
+    except KeyboardInterrupt:
+        pass
+
+async def _worker(index: int, updates_q, rows_q, ack_q):
+    from aiogram import Bot, Dispatcher
+    from handlers import register_routers
+    from services import thread_manager
+    from services.storage import SQLiteStorage
+    from services.tenants import load_tenants, TenantMiddleware
+    from services import outbox
+    from handlers.fsm_engine import deliver_queued
+
+    thread_manager.use_sqlite(STATE_DB)
+    # Режим воркеров — всегда один бот; заявки уходят писателю в приемник, ответ — в ack_q
+    tenant = load_tenants()[0]
+    tenant.store.writer_queue = rows_q
+    tenant.store.ack_queue = ack_q
+    tenant.store.worker_index = index
+    acks = asyncio.create_task(tenant.store.run_acks())
+
+    bot = Bot(token=tenant.bot_token)
+    tenant.bot = bot
+    # Сообщения координаторам, отложенные этим воркером, он же и досылает
+    outbox.set_owner(f"worker{index}")
+    drainer = asyncio.create_task(outbox.drain("admin", {tenant.name: tenant}, lambda t: t.admin_breaker, deliver_queued))
+    dp = Dispatcher(storage=SQLiteStorage(STATE_DB))
+    dp.update.outer_middleware(TenantMiddleware({bot.id: tenant}))
+    register_routers(dp)
+    logging.getLogger(__name__).info(f"🟢 Воркер {index} готов")
+
+    tasks = set()
+    try:
+        while True:
+            raw = await asyncio.to_thread(updates_q.get)
+            if raw is None: break
+            # Как в обычном Polling: каждый апдейт — отдельная задача
+            task = asyncio.create_task(dp.feed_raw_update(bot, raw))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        if tasks: await asyncio.gather(*tasks, return_exceptions=True)
+    finally:
+        drainer.cancel()
+        acks.cancel()
+        await dp.storage.close()
+        await bot.session.close()
+
+def _start_worker(ctx, index: int, updates_q, rows_q, ack_q):
+    proc = ctx.Process(target=_worker_main, args=(index, updates_q, rows_q, ack_q), daemon=True, name=f"worker{index}")
+    proc.start()
+    return proc
+
+async def run_cluster(bot, workers: int, tenant):
+    """Приемник: getUpdates -> очередь воркера, плюс цикл писателя xlsx."""
+    # spawn — единственный вариант на Windows, используем его везде для одинакового поведения
+    ctx = multiprocessing.get_context("spawn")
+    rows_q = ctx.Queue()
+    queues = [ctx.Queue() for _ in range(workers)]
+    acks = [ctx.Queue() for _ in range(workers)]
+    procs = [_start_worker(ctx, i, queues[i], rows_q, acks[i]) for i in range(workers)]
+    # Правки строк, влитые из облака, воркеры берут из журнала для своих индексов /find
+    tenant.store.publish_edits = True
+    writer = asyncio.create_task(tenant.store.run_writer(rows_q, acks))
+
+    offset = None
+    try:
+        while True:
+            try:
+                updates = await bot.get_updates(offset=offset, timeout=25)
+            except Exception as e:
+                logger.error(f"Ошибка получения апдейтов: {e}")
+                await asyncio.sleep(5)
+                continue
+
+            for i, proc in enumerate(procs):
+                if not proc.is_alive():
+                    logger.warning(f"⚠️ Воркер {i} упал, перезапуск...")
+                    procs[i] = _start_worker(ctx, i, queues[i], rows_q, acks[i])
+
+            for update in updates:
+                offset = update.update_id + 1
+                raw = update.model_dump(mode="json", by_alias=True, exclude_none=True)
+                queues[_shard(update, workers)].put(raw)
+    finally:
+        for q in queues: q.put(None)
+        rows_q.put(None)
+        await asyncio.gather(writer, return_exceptions=True)
+        for q in acks: q.put(None)
+        for proc in procs: proc.join(timeout=10)
@@ -0,0 +1,19 @@
+# services/context.py
+# Текущий бот (тенант) для обрабатываемого апдейта. Ставится в TenantMiddleware,
+# наследуется всеми задачами, созданными внутри обработчика.
+from contextvars import ContextVar
+
+_current = ContextVar("tenant", default=None)
+
+def current_tenant():
+    return _current.get()
+
+def set_current_tenant(tenant):
+    return _current.set(tenant)
+
+def reset_current_tenant(token):
+    _current.reset(token)
+
+def tenant_name() -> str:
+    tenant = _current.get()
+    return tenant.name if tenant else "default"
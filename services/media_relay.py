@@ -0,0 +1,138 @@
+# services/media_relay.py
+# Пересылка медиа между пользователем и группой координаторов по file_id:
+# файлы не скачиваются на сервер и не загружаются обратно.
+import asyncio
+from aiogram import Bot, types
+
+# Сколько ждать остальные части альбома (Telegram присылает их отдельными апдейтами)
+ALBUM_DELAY = 1.0
+# Лимиты Telegram: подпись к медиа и текст сообщения
+CAPTION_LIMIT = 1024
+TEXT_LIMIT = 4096
+# Серия текстов в диалоге: место под заголовок (имя, username, этап) остается в пределах TEXT_LIMIT
+BURST_CHARS = TEXT_LIMIT - 400
+
+# Типы, к которым можно прицепить подпись (заголовок #id уходит в caption)
+CAPTION_TYPES = {"photo", "video", "document", "audio", "voice", "animation"}
+
+# Буфер альбомов: {media_group_id: [Message, ...]}
+_albums = {}
+
+# Буфер серий текстов в режиме диалога: {key: {"messages": [...], "chars", "full": Event, "sent": Event}}
+_bursts = {}
+# Событие «отправлена» последней серии каждого key — по нему следующие серии и медиа ждут своей очереди
+_burst_sent = {}
+
+def join_caption(header: str, caption: str = ""):
+    """Заголовок + подпись или None, если вместе они не влезают в подпись к медиа
+    (тогда заголовок уходит отдельным сообщением, подпись не режется)."""
+    text = f"{header}\n{caption}" if caption else header
+    return text if len(text) <= CAPTION_LIMIT else None
+
+async def gather_album(message: types.Message):
+    """Собирает альбом. Первая часть ждет остальные и возвращает весь список,
+    остальные части возвращают None (их отправит первая)."""
+    group_id = message.media_group_id
+    if group_id in _albums:
+        _albums[group_id].append(message)
+        return None
+    _albums[group_id] = [message]
+    await asyncio.sleep(ALBUM_DELAY)
+    return sorted(_albums.pop(group_id, []), key=lambda m: m.message_id)
+
+async def gather_burst(key, message: types.Message, window: float, send, max_messages: int = 10, max_chars: int = BURST_CHARS):
+    """Склеивает серию текстов одного пользователя и отправляет ее одним вызовом send(messages).
+    Серия закрывается через window секунд, на max_messages сообщениях или перед сообщением,
+    с которым текст превысил бы max_chars (тогда это сообщение начинает следующую серию).
+    Серии одного key уходят строго по порядку. Первое сообщение серии возвращает результат send,
+    остальные — None."""
+    size = len(message.text or "")
+    burst = _bursts.get(key)
+    if burst and burst["chars"] + 1 + size <= max_chars:
+        burst["messages"].append(message)
+        burst["chars"] += 1 + size
+        if len(burst["messages"]) >= max_messages: burst["full"].set()
+        return None
+    # Не влезает — текущая серия уходит сейчас
+    if burst: burst["full"].set()
+    burst = _bursts[key] = {"messages": [message], "chars": size, "full": asyncio.Event(), "sent": asyncio.Event()}
+    previous = _burst_sent.get(key)
+    _burst_sent[key] = burst["sent"]
+    if size >= max_chars: burst["full"].set()
+    try:
+        await asyncio.wait_for(burst["full"].wait(), window)
+    except asyncio.TimeoutError:
+        pass
+    if _bursts.get(key) is burst: del _bursts[key]
+    try:
+        if previous: await previous.wait()
+        return await send(burst["messages"])
+    finally:
+        burst["sent"].set()
+        if _burst_sent.get(key) is burst["sent"]: del _burst_sent[key]
+
+async def flush_burst(key):
+    """Досылает начатую серию и ждет отправки (медиа не должно обогнать текст, набранный раньше)."""
+    burst = _bursts.get(key)
+    if burst: burst["full"].set()
+    sent = _burst_sent.get(key)
+    if sent: await sent.wait()
+
+async def send_text(bot: Bot, chat_id: int, header: str, text: str, reply_to: int = None) -> list:
+    """Заголовок + текст одним сообщением; если вместе не влезают в лимит Telegram —
+    заголовок отдельно, текст ответом на него."""
+    if len(header) + 1 + len(text) <= TEXT_LIMIT:
+        sent = await bot.send_message(chat_id=chat_id, text=f"{header}\n{text}", parse_mode="HTML", reply_to_message_id=reply_to)
+        return [sent.message_id]
+    head = await bot.send_message(chat_id=chat_id, text=header, parse_mode="HTML", reply_to_message_id=reply_to)
+    sent = await bot.send_message(chat_id=chat_id, text=text, parse_mode="HTML", reply_to_message_id=head.message_id)
+    return [head.message_id, sent.message_id]
+
+def _input_media(message: types.Message, caption: str = None):
+    kw = {"caption": caption, "parse_mode": "HTML"}
+    if message.photo: return types.InputMediaPhoto(media=message.photo[-1].file_id, **kw)
+    if message.video: return types.InputMediaVideo(media=message.video.file_id, **kw)
+    if message.document: return types.InputMediaDocument(media=message.document.file_id, **kw)
+    if message.audio: return types.InputMediaAudio(media=message.audio.file_id, **kw)
+    return None
+
+async def send_album(bot: Bot, chat_id: int, album: list, header: str, reply_to: int = None) -> list:
+    """Один sendMediaGroup на весь альбом, заголовок — подпись первого элемента
+    (или отдельное сообщение, на которое отвечает альбом, если с подписью не влезает)."""
+    captions = [m.html_text if m.caption else "" for m in album]
+    first = join_caption(header, captions[0]) if captions else header
+    head_ids = []
+    if first is None:
+        head = await bot.send_message(chat_id=chat_id, text=header, parse_mode="HTML", reply_to_message_id=reply_to)
+        head_ids, reply_to, first = [head.message_id], head.message_id, captions[0]
+    media = []
+    for i, m in enumerate(album):
+        item = _input_media(m, first if i == 0 else (captions[i] or None))
+        if item: media.append(item)
+    if not media: return head_ids
+    sent = await bot.send_media_group(chat_id=chat_id, media=media, reply_to_message_id=reply_to)
+    return head_ids + [m.message_id for m in sent]
+
+async def copy_with_header(bot: Bot, chat_id: int, from_chat_id: int, message_id: int, content_type: str,
+                           header: str, caption: str = "", reply_to: int = None) -> list:
+    """Копирует сообщение по id (copyMessage). Заголовок идет подписью, а для стикеров/кружков
+    и длинных подписей — отдельным сообщением, на которое отвечает копия со своей подписью."""
+    content_type = getattr(content_type, "value", content_type)
+    if content_type in CAPTION_TYPES and join_caption(header, caption) is not None:
+        res = await bot.copy_message(
+            chat_id=chat_id, from_chat_id=from_chat_id, message_id=message_id,
+            caption=join_caption(header, caption), parse_mode="HTML", reply_to_message_id=reply_to
+        )
+        return [res.message_id]
+    head = await bot.send_message(chat_id=chat_id, text=header, parse_mode="HTML", reply_to_message_id=reply_to)
+    res = await bot.copy_message(chat_id=chat_id, from_chat_id=from_chat_id, message_id=message_id, reply_to_message_id=head.message_id)
+    return [head.message_id, res.message_id]
+
+async def relay(bot: Bot, chat_id: int, message: types.Message, header: str, reply_to: int = None, album: list = None) -> list:
+    """Пересылает текст, медиа или альбом. Возвращает id отправленных сообщений."""
+    if album:
+        return await send_album(bot, chat_id, album, header, reply_to)
+    if message.text:
+        return await send_text(bot, chat_id, header, message.html_text, reply_to)
+    caption = message.html_text if message.caption else ""
+    return await copy_with_header(bot, chat_id, message.chat.id, message.message_id, message.content_type, header, caption, reply_to)
@@ -0,0 +1,97 @@
+# services/outbox.py
+# Долговечная очередь работы для недоступного сервиса (OUTBOX_DB, SQLite).
+# Задания переживают перезапуск бота и разбираются по порядку фоновой задачей drain,
+# как только предохранитель сервиса позволяет.
+import json
+import time
+import asyncio
+import logging
+
+from config import OUTBOX_DB
+from services.context import set_current_tenant, reset_current_tenant
+
+logger = logging.getLogger(__name__)
+
+# Как часто проверять очередь (и делать пробную попытку при разомкнутом предохранителе)
+DRAIN_INTERVAL = 5
+
+_db = None
+
+class RetryLater(Exception):
+    """Задание не выполнено по местной причине (например, файл занят): повторить позже,
+    предохранитель сервиса не трогать."""
+# Чьи задания разбирает этот процесс: в режиме воркеров у каждого процесса свои
+_owner = "main"
+
+def set_owner(owner: str):
+    global _owner
+    _owner = owner
+
+def _conn():
+    global _db
+    if _db is None:
+        from services.storage import connect
+        _db = connect(OUTBOX_DB)
+        _db.execute(
+            "CREATE TABLE IF NOT EXISTS outbox (id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " owner TEXT, kind TEXT, tenant TEXT, payload TEXT, created REAL)"
+        )
+    return _db
+
+def has(kind: str, tenant: str) -> bool:
+    row = _conn().execute(
+        "SELECT 1 FROM outbox WHERE owner = ? AND kind = ? AND tenant = ? LIMIT 1", (_owner, kind, tenant)
+    ).fetchone()
+    return row is not None
+
+def put(kind: str, tenant: str, payload: dict = None, unique: bool = False):
+    """unique=True — задание-флаг («выгрузить файл»): второе такое же не добавляется."""
+    if unique and has(kind, tenant): return
+    _conn().execute(
+        "INSERT INTO outbox (owner, kind, tenant, payload, created) VALUES (?, ?, ?, ?, ?)",
+        (_owner, kind, tenant, json.dumps(payload or {}, ensure_ascii=False), time.time())
+    )
+
+def items(kind: str) -> list:
+    rows = _conn().execute(
+        "SELECT id, tenant, payload FROM outbox WHERE owner = ? AND kind = ? ORDER BY id", (_owner, kind)
+    ).fetchall()
+    return [(item_id, tenant, json.loads(payload)) for item_id, tenant, payload in rows]
+
+def remove(item_id: int):
+    _conn().execute("DELETE FROM outbox WHERE id = ?", (item_id,))
+
+async def drain(kind: str, tenants: dict, breaker_for, handle):
+    """Фоновая задача. tenants: {имя: Tenant}; breaker_for(tenant) -> CircuitBreaker;
+    handle(tenant, payload) выполняет задание. Ошибка размыкает предохранитель,
+    задание остается в очереди и повторится после следующей пробной попытки."""
+    while True:
+        await asyncio.sleep(DRAIN_INTERVAL)
+        blocked = set()
+        for item_id, name, payload in items(kind):
+            if name in blocked: continue
+            tenant = tenants.get(name)
+            if tenant is None:
+                logger.error(f"Outbox: бот '{name}' больше не настроен, задание {kind} #{item_id} удалено")
+                remove(item_id)
+                continue
+            breaker = breaker_for(tenant)
+            if not breaker.ready():
+                blocked.add(name)
+                continue
+            token = set_current_tenant(tenant)
+            try:
+                await handle(tenant, payload)
+            except RetryLater as e:
+                logger.warning(f"Outbox: задание {kind} #{item_id} отложено: {e}")
+                blocked.add(name)
+                continue
+            except Exception as e:
+                breaker.failure(e)
+                # Порядок заданий одного бота сохраняем: следующие ждут этого
+                blocked.add(name)
+                continue
+            finally:
+                reset_current_tenant(token)
+            remove(item_id)
+            breaker.success()
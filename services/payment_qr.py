@@ -0,0 +1,71 @@
+# services/payment_qr.py
+# QR-код для оплаты по стандарту ST00012 с суммой конкретной заявки.
+# Картинка рисуется в процессе пула и кешируется; после первой отправки
+# повторно уходит по file_id Telegram — без отрисовки и без загрузки.
+import io
+from collections import OrderedDict
+from aiogram.types import BufferedInputFile
+
+CACHE_SIZE = 256
+
+# {строка ST00012 (реквизиты, сумма, назначение): PNG}
+_png_cache = OrderedDict()
+# {(bot_id, строка ST00012): file_id}
+_file_ids = OrderedDict()
+
+def build_payload(details: dict, amount_kop: int = None, purpose: str = None) -> str:
+    """Строка ST00012. Sum — в копейках; '|' внутри значений недопустим."""
+    fields = [
+        ("Name", details.get("name")),
+        ("PersonalAcc", details.get("personal_acc")),
+        ("BankName", details.get("bank_name")),
+        ("BIC", details.get("bic")),
+        ("CorrespAcc", details.get("corresp_acc")),
+        ("PayeeINN", details.get("payee_inn")),
+    ]
+    if amount_kop: fields.append(("Sum", amount_kop))
+    fields.append(("Purpose", purpose or details.get("purpose", "")))
+    return "ST00012|" + "|".join(f"{k}={str(v).replace('|', ' ')}" for k, v in fields if v not in (None, ""))
+
+def render_png(payload: str) -> bytes:
+    """Отрисовка (CPU). Выполняется в процессе пула."""
+    import qrcode
+    qr = qrcode.QRCode(
+        version=None,
+        error_correction=qrcode.constants.ERROR_CORRECT_M,
+        box_size=10,
+        border=4,
+    )
+    qr.add_data(payload)
+    qr.make(fit=True)
+    img = qr.make_image(fill_color="black", back_color="white")
+    buf = io.BytesIO()
+    img.save(buf, format="PNG")
+    return buf.getvalue()
+
+def _remember(cache: OrderedDict, key, value):
+    cache[key] = value
+    cache.move_to_end(key)
+    if len(cache) > CACHE_SIZE: cache.popitem(last=False)
+
+async def get_qr_photo(bot_id: int, details: dict, amount_rub, purpose: str):
+    """(file_id или PNG для загрузки, ключ для remember_file_id).
+    file_id действует только для того бота, который отправил картинку, поэтому ключ с bot_id."""
+    from services.pool import run_in_pool
+    payload = build_payload(details, int(round(float(amount_rub) * 100)), purpose)
+    key = (bot_id, payload)
+    if key in _file_ids:
+        _file_ids.move_to_end(key)
+        return _file_ids[key], key
+    png = _png_cache.get(payload)
+    if png is None:
+        png = await run_in_pool(render_png, payload)
+        _remember(_png_cache, payload, png)
+    else:
+        _png_cache.move_to_end(payload)
+    return BufferedInputFile(png, filename="payment_qr.png"), key
+
+def remember_file_id(key, sent_message):
+    """После отправки запоминаем file_id: повторная отправка пойдет без отрисовки и загрузки."""
+    if not sent_message or not sent_message.photo: return
+    _remember(_file_ids, key, sent_message.photo[-1].file_id)
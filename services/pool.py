@@ -0,0 +1,65 @@
+# services/pool.py
+# Отдельный процесс для CPU-работы (openpyxl, отрисовка QR): чистый Python держит GIL
+# сотни миллисекунд и в потоке тормозил бы весь цикл событий.
+import time
+import asyncio
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+logger = logging.getLogger(__name__)
+
+_pool = None
+
+def _warmup():
+    """Поднимает процесс пула и заранее импортирует тяжелые библиотеки."""
+    import openpyxl
+    try: import qrcode
+    except ImportError: pass
+    return True
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+def _timed(func, *args):
+    """Обертка в процессе пула: результат и чистое время работы func."""
+    started = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - started
+
+async def start_pool():
+    """Прогрев пула при старте, чтобы первая заявка не ждала запуска процесса."""
+    await asyncio.get_running_loop().run_in_executor(_get_pool(), _warmup)
+
+async def run_in_pool(func, *args):
+    """Выполняет func в процессе пула. В лог: полное время, из него ожидание в очереди пула
+    (процесс один, задачи идут по очереди) и насколько за это время отстал цикл событий."""
+    global _pool
+    loop = asyncio.get_running_loop()
+    max_lag = 0.0
+
+    async def probe():
+        nonlocal max_lag
+        while True:
+            t = loop.time()
+            await asyncio.sleep(0.05)
+            max_lag = max(max_lag, loop.time() - t - 0.05)
+
+    probe_task = asyncio.create_task(probe())
+    started = loop.time()
+    work = None
+    try:
+        result, work = await loop.run_in_executor(_get_pool(), _timed, func, *args)
+        return result
+    except BrokenProcessPool:
+        _pool = None
+        raise IOError("Рабочий процесс аварийно завершился.")
+    finally:
+        probe_task.cancel()
+        total = loop.time() - started
+        queued = f", в очереди {(total - work) * 1000:.0f} мс" if work is not None else ""
+        logger.info(f"{func.__name__}: {total * 1000:.0f} мс{queued}, задержка цикла {max_lag * 1000:.0f} мс")
@@ -0,0 +1,84 @@
+# services/search_index.py
+# Индекс подписчиков в памяти для /find: триграммы по ФИО, цифрам телефона, username и user_id.
+from array import array
+
+def normalize_text(value) -> str:
+    return str(value or "").lower().replace("ё", "е").strip()
+
+def normalize_phone(value) -> str:
+    digits = "".join(ch for ch in str(value or "") if ch.isdigit())
+    # 8XXXXXXXXXX и 7XXXXXXXXXX — один и тот же номер
+    if len(digits) == 11 and digits[0] == "8": digits = "7" + digits[1:]
+    return digits
+
+def _grams(text: str):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+class SubscriberIndex:
+    """Строки хранятся в порядке файла (номер строки = id), списки id в триграммах — array('I').
+    Обновление строки не вычищает старые триграммы: лишние кандидаты отсекаются проверкой по тексту."""
+
+    MIN_QUERY = 3
+
+    def __init__(self):
+        self.rows = []     # [(дата, user_id, username, ФИО, телефон)]
+        self.hay = []      # нормализованный текст строки для проверки совпадения
+        self.grams = {}    # {триграмма: array('I', [id, ...])}
+        self.mtime = None  # mtime файла, до которого индекс актуален
+
+    def __len__(self):
+        return len(self.rows)
+
+    def _index(self, row_id: int, hay: str):
+        for gram in _grams(hay):
+            ids = self.grams.get(gram)
+            if ids is None:
+                ids = self.grams[gram] = array("I")
+            if not ids or ids[-1] != row_id: ids.append(row_id)
+
+    def set_row(self, row_id: int, row):
+        """Добавляет (row_id == len) или заменяет строку. row — полная строка xlsx."""
+        row = list(row) + [None] * (7 - len(row))
+        user_id = str(row[1] or "").strip()
+        if user_id.endswith(".0"): user_id = user_id[:-2]
+        item = (str(row[0] or ""), user_id, str(row[2] or ""), str(row[4] or ""), str(row[6] or ""))
+        # Разделитель \x00 не дает триграммам склеиваться между полями
+        hay = "\x00".join((normalize_text(item[3]), normalize_phone(item[4]), normalize_text(item[2]).lstrip("@"), user_id))
+        if row_id == len(self.rows):
+            self.rows.append(item)
+            self.hay.append(hay)
+        else:
+            self.rows[row_id] = item
+            self.hay[row_id] = hay
+        self._index(row_id, hay)
+
+    def add(self, row):
+        self.set_row(len(self.rows), row)
+
+    def _tokens(self, query: str) -> list:
+        digits = normalize_phone(query)
+        # Запрос вида "+7 (999) 123-45-67" — один токен из цифр
+        if digits and all(ch.isdigit() or ch in "+-() " for ch in query.strip()):
+            return [digits]
+        return [normalize_text(t).lstrip("@") for t in query.split() if t.strip()]
+
+    def search(self, query: str, limit: int = 10) -> list:
+        tokens = [t for t in self._tokens(query) if len(t) >= self.MIN_QUERY]
+        if not tokens: return []
+        # Кандидаты — самый короткий список id среди всех триграмм запроса;
+        # идем от свежих к старым и останавливаемся, как только набрали limit
+        shortest = min((self.grams.get(g, ()) for t in tokens for g in _grams(t)), key=len)
+        # Свежие заявки первыми, по одной на пользователя
+        result, seen = [], set()
+        last = None
+        for row_id in reversed(shortest):
+            if row_id == last: continue
+            last = row_id
+            hay = self.hay[row_id]
+            if not all(t in hay for t in tokens): continue
+            item = self.rows[row_id]
+            if item[1] in seen: continue
+            seen.add(item[1])
+            result.append(item)
+            if len(result) >= limit: break
+        return result
@@ -0,0 +1,93 @@
+# services/segments.py
+# Режим SYNC_MODE=segments: вместо всего subscriptions.xlsx в облако уходят
+# маленькие неизменяемые файлы-части (одна пачка заявок — одна часть в папке дня).
+# Уже записанная часть больше не меняется, поэтому объем выгрузки на заявку не растет
+# ни с историей, ни с числом заявок за день. manifest.json и полная книга
+# выгружаются при плановой консолидации (CONSOLIDATE_HOURS).
+# write_parts выполняется в процессе пула вместе с записью xlsx, upload_parts — в потоке (сеть).
+import os
+import json
+import hashlib
+import logging
+from datetime import datetime
+from openpyxl import Workbook
+
+logger = logging.getLogger(__name__)
+
+MANIFEST = "manifest.json"
+
+def remote_dir_for(remote_dir: str) -> str:
+    """Папка сегментов в облаке — рядом с основным файлом."""
+    return f"{remote_dir}/segments"
+
+def day_of(row) -> str:
+    """Дата заявки 'YYYY-MM-DD HH:MM' -> папка дня."""
+    return str(row[0] or "")[:10] or datetime.now().strftime("%Y-%m-%d")
+
+def file_md5(path: str) -> str:
+    h = hashlib.md5()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(65536), b""): h.update(chunk)
+    return h.hexdigest()
+
+def _load_manifest(segments_dir: str) -> dict:
+    path = os.path.join(segments_dir, MANIFEST)
+    manifest = {}
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as f: manifest = json.load(f)
+    # {"день/part_....xlsx": {"rows", "md5", "uploaded"}}
+    manifest.setdefault("parts", {})
+    return manifest
+
+def _save_manifest(segments_dir: str, manifest: dict):
+    manifest["updated"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    os.makedirs(segments_dir, exist_ok=True)
+    path = os.path.join(segments_dir, MANIFEST)
+    with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1)
+    os.replace(f"{path}.tmp", path)
+
+def write_parts(segments_dir: str, rows: list, headers: list) -> list:
+    """Новые строки -> новые части (существующие файлы не трогаются). Возвращает имена частей."""
+    by_day = {}
+    for row in rows: by_day.setdefault(day_of(row), []).append(row)
+
+    manifest = _load_manifest(segments_dir)
+    stamp = datetime.now().strftime("%H%M%S%f")
+    names = []
+    for day, day_rows in by_day.items():
+        os.makedirs(os.path.join(segments_dir, day), exist_ok=True)
+        name, n = f"{day}/part_{stamp}.xlsx", 1
+        while name in manifest["parts"]:
+            n += 1
+            name = f"{day}/part_{stamp}_{n}.xlsx"
+        path = os.path.join(segments_dir, name)
+        wb = Workbook()
+        ws = wb.active
+        ws.append(headers)
+        for row in day_rows: ws.append(row)
+        wb.save(f"{path}.tmp")
+        os.replace(f"{path}.tmp", path)
+        manifest["parts"][name] = {"rows": len(day_rows), "md5": file_md5(path), "uploaded": False}
+        names.append(name)
+    _save_manifest(segments_dir, manifest)
+    return names
+
+def pending_parts(segments_dir: str) -> list:
+    """Части, которые еще не выгружены (по манифесту, без запросов к облаку)."""
+    return [name for name, info in _load_manifest(segments_dir)["parts"].items() if not info.get("uploaded")]
+
+def upload_parts(upload, ensure_dir, segments_dir: str, remote_dir: str, names: list, with_manifest: bool = False):
+    """Выгружает части как новые файлы (сверять md5 с облаком незачем) и отмечает их в манифесте."""
+    manifest = _load_manifest(segments_dir)
+    try:
+        for name in names:
+            ensure_dir(f"{remote_dir}/{os.path.dirname(name)}")
+            upload(os.path.join(segments_dir, name), f"{remote_dir}/{name}")
+            manifest["parts"][name]["uploaded"] = True
+    finally:
+        _save_manifest(segments_dir, manifest)
+    if with_manifest:
+        ensure_dir(remote_dir)
+        upload(os.path.join(segments_dir, MANIFEST), f"{remote_dir}/{MANIFEST}")
+    logger.info(f"Сегменты: выгружено частей {len(names)}" + (" и манифест" if with_manifest else ""))
@@ -1,31 +1,54 @@
 import asyncio
 import logging
 import os
+import json
+import uuid
+import shutil
 import openpyxl
 from openpyxl import Workbook
 import yadisk
 from yadisk.exceptions import LockedError
-from config import YANDEX_TOKEN, EXCEL_FILE, YANDEX_DIR, REMOTE_PATH_SUBS
+from config import YANDEX_TOKEN, SYNC_MODE, CONSOLIDATE_HOURS, SYNC_DOWN_MINUTES
+from services import segments
+from services.search_index import SubscriberIndex
+from services.pool import run_in_pool
+from services.breaker import CircuitBreaker
+from services import outbox
 
 logger = logging.getLogger(__name__)
-file_lock = asyncio.Lock()
 
+# Сколько воркер ждет подтверждения записи от приемника
+WRITE_ACK_TIMEOUT = 60
+
+# Один аккаунт Яндекс.Диска на все боты процесса
 try:
     y = yadisk.YaDisk(token=YANDEX_TOKEN)
 except Exception as e:
     y = None
 
+# Общий на все боты: недоступен аккаунт — недоступен всем
+cloud_breaker = CircuitBreaker("Яндекс.Диск")
+
 class CloudUploadError(Exception):
     pass
 
+class LocalFileError(outbox.RetryLater):
+    """Локальный файл недоступен (например, открыт в Excel): облако тут ни при чем,
+    предохранитель Яндекс.Диска не размыкаем."""
+
+# Папки, которые уже точно есть в облаке: не проверяем их на каждой выгрузке
+_known_dirs = set()
+
 def _ensure_remote_dir_exists(client: yadisk.YaDisk, path: str):
+    if path in _known_dirs: return
     parts = path.strip("/").split("/")
     current_path = ""
     for part in parts:
         current_path += f"/{part}"
         try:
             if not client.exists(current_path): client.mkdir(current_path)
-        except Exception: pass
+        except Exception: return
+    _known_dirs.add(path)
 
 def _set_column_widths(ws):
     widths = {'A': 18, 'B': 15, 'C': 20, 'D': 20, 'E': 35, 'F': 50, 'G': 18, 'H': 25, 'I': 12}
@@ -42,7 +65,22 @@ def _update_headers_if_needed(ws, new_headers: list):
             _set_column_widths(ws)
     except Exception: pass
 
-def _save_to_excel_sync(filename: str, remote_path: str, data: list, headers: list):
+def _remote_path(filename: str, remote_dir: str) -> str:
+    return f"{remote_dir}/{os.path.basename(filename)}"
+
+def _id_column(ws) -> int:
+    """Номер колонки ID заявки (ищется по заголовку — координаторы могли добавить свои колонки).
+    Если ее нет — заводится в первой свободной колонке после заголовков."""
+    headers = [cell.value for cell in ws[1]]
+    if ROW_ID_HEADER in headers: return headers.index(ROW_ID_HEADER) + 1
+    col = max(len(HEADERS), max((i for i, h in enumerate(headers, 1) if h is not None), default=0)) + 1
+    ws.cell(row=1, column=col, value=ROW_ID_HEADER)
+    return col
+
+def _save_to_excel_sync(paths: tuple, rows: list, headers: list):
+    """Только локальная запись (процесс пула). Строка: колонки headers + ID заявки последним элементом.
+    Возвращает новые части сегментов для выгрузки."""
+    filename, remote_dir, segments_dir = paths
     if not os.path.exists(filename):
         wb = Workbook()
         ws = wb.active
@@ -53,36 +91,86 @@ def _save_to_excel_sync(filename: str, remote_path: str, data: list, headers: li
         wb = openpyxl.load_workbook(filename)
         ws = wb.active
         _update_headers_if_needed(ws, headers)
-        ws.append(data)
-        wb.save(filename)
+        id_col = _id_column(ws)
+        for row in rows:
+            ws.append(list(row[:len(headers)]) + [None] * (id_col - 1 - len(headers)) + [row[len(headers)]])
+        # Пишем во временный файл и подменяем: читатели из других процессов не увидят полузаписанный xlsx
+        tmp_name = f"{filename}.tmp"
+        wb.save(tmp_name)
+        os.replace(tmp_name, filename)
     except PermissionError:
         raise IOError(f"Файл {filename} открыт.")
 
+    # Сегменты ведутся локально всегда: невыгруженные догонит плановая синхронизация по md5
+    return segments.write_parts(segments_dir, rows, headers + [ROW_ID_HEADER]) if SYNC_MODE == "segments" else []
+
+# Сетевые функции выполняются в потоке (asyncio.to_thread), а не в процессе пула:
+# медленный Яндекс не должен задерживать чтение истории, /find и отрисовку QR
+
+def _push_sync(paths: tuple, changed: list = None):
+    """Выгрузка в облако. changed — только что записанные части;
+    None (досылка из outbox) — все невыгруженные части по манифесту и сам манифест."""
+    filename, remote_dir, segments_dir = paths
     if not y: return
     try:
         if not y.check_token(): raise CloudUploadError("Invalid Token")
-        _ensure_remote_dir_exists(y, YANDEX_DIR)
-        try:
-            y.upload(filename, remote_path, overwrite=True)
-        except LockedError:
-            y.remove(remote_path)
-            import time; time.sleep(1)
-            y.upload(filename, remote_path, overwrite=True)
+        if SYNC_MODE == "segments":
+            # Объем выгрузки не растет: только новые части с этими строками
+            names = changed if changed is not None else segments.pending_parts(segments_dir)
+            segments.upload_parts(
+                _upload, lambda path: _ensure_remote_dir_exists(y, path),
+                segments_dir, segments.remote_dir_for(remote_dir), names, with_manifest=changed is None
+            )
+        else:
+            _ensure_remote_dir_exists(y, remote_dir)
+            return _upload_book(filename, remote_dir)
     except Exception as e:
         if isinstance(e, CloudUploadError): raise e
         raise CloudUploadError(f"Upload fail: {e}")
 
-async def add_subscription(user_data: list):
-    headers = ["Дата", "User ID", "Username", "Тип подписки", "ФИО", "Способ получения / Доставка", "Телефон", "Выбранные номера", "Согласие ПД"]
-    async with file_lock:
-        await asyncio.to_thread(_save_to_excel_sync, EXCEL_FILE, REMOTE_PATH_SUBS, user_data, headers)
+def _upload(filename: str, remote_path: str):
+    """Выгружает файл и возвращает его md5 (такой же покажет Яндекс)."""
+    try:
+        y.upload(filename, remote_path, overwrite=True)
+    except LockedError:
+        y.remove(remote_path)
+        import time; time.sleep(1)
+        y.upload(filename, remote_path, overwrite=True)
+    return segments.file_md5(filename)
+
+def _consolidate_sync(paths: tuple):
+    """Плановая выгрузка: догоняем невыгруженные части (по манифесту), манифест и полную книгу."""
+    filename, remote_dir, segments_dir = paths
+    if not y or not os.path.exists(filename): return
+    segments.upload_parts(
+        _upload, lambda path: _ensure_remote_dir_exists(y, path),
+        segments_dir, segments.remote_dir_for(remote_dir), segments.pending_parts(segments_dir), with_manifest=True
+    )
+    _ensure_remote_dir_exists(y, remote_dir)
+    return _upload_book(filename, remote_dir)
+
+def _base_path(filename: str) -> str:
+    """Копия версии, которая последней точно лежала в облаке: база для поиска удаленных строк."""
+    return f"{os.path.splitext(filename)[0]}.synced.xlsx"
+
+def _upload_book(filename: str, remote_dir: str):
+    md5 = _upload(filename, _remote_path(filename, remote_dir))
+    shutil.copyfile(filename, _base_path(filename))
+    return md5
 
-def find_last_subscription(user_id: int):
+HEADERS = ["Дата", "User ID", "Username", "Тип подписки", "ФИО", "Способ получения / Доставка", "Телефон", "Выбранные номера", "Согласие ПД"]
+# Устойчивый идентификатор строки: по нему сопоставляются строки локального и облачного файлов
+ROW_ID_HEADER = "ID заявки"
+
+def new_row_id() -> str:
+    return uuid.uuid4().hex[:12]
+
+def _find_last_subscription_sync(filename: str, user_id: int):
     """Ищет запись СТРОГО по новой структуре колонок."""
-    if not os.path.exists(EXCEL_FILE):
+    if not os.path.exists(filename):
         return None
     try:
-        wb = openpyxl.load_workbook(EXCEL_FILE, read_only=True)
+        wb = openpyxl.load_workbook(filename, read_only=True)
         ws = wb.active
         target_id = str(user_id).strip()
         found_data = None
@@ -106,4 +194,457 @@ def find_last_subscription(user_id: int):
         return found_data
     except Exception as e:
         logger.error(f"Ошибка чтения истории: {e}")
-        return None
\ No newline at end of file
+        return None
+
+def _count_rows_sync(filename: str):
+    """Количество заявок (без заголовка) или None, если файла еще нет."""
+    if not os.path.exists(filename):
+        return None
+    wb = openpyxl.load_workbook(filename, read_only=True)
+    try:
+        # max_row может врать, если есть пустые строки,
+        # но для наших целей (append) это обычно работает корректно.
+        return max(wb.active.max_row - 1, 0)
+    finally:
+        wb.close()
+
+def _read_rows_sync(filename: str, start: int):
+    """Строки данных, начиная с start (0 — первая строка после заголовка)."""
+    if not os.path.exists(filename):
+        return []
+    wb = openpyxl.load_workbook(filename, read_only=True)
+    try:
+        return [tuple(row[:7]) for row in wb.active.iter_rows(min_row=start + 2, values_only=True)]
+    finally:
+        wb.close()
+
+def _cell_str(value) -> str:
+    value = str(value if value is not None else "").strip()
+    return value[:-2] if value.endswith(".0") else value
+
+def _layout(header_row) -> tuple:
+    """Индексы колонок (ID заявки, Дата, User ID) по тексту заголовков: координаторы могут
+    вставлять свои колонки. У файлов без таких заголовков — исходные позиции."""
+    names = [_cell_str(h) for h in header_row or []]
+    def index(name, default): return names.index(name) if name in names else default
+    return index(ROW_ID_HEADER, None), index(HEADERS[0], 0), index(HEADERS[1], 1)
+
+def _row_key(row, layout=(None, 0, 1)) -> tuple:
+    """Строка определяется ID заявки; у старых строк без ID — датой (до минуты) и User ID."""
+    id_idx, date_idx, uid_idx = layout
+    def cell(idx): return _cell_str(row[idx]) if idx is not None and idx < len(row) else ""
+    row_id = cell(id_idx)
+    if row_id: return ("id", row_id)
+    return (cell(date_idx)[:16], cell(uid_idx))
+
+def _has_user(row, layout) -> bool:
+    uid_idx = layout[2]
+    return bool(row) and uid_idx < len(row) and row[uid_idx] is not None
+
+def _map_columns(remote_header, local_header) -> tuple:
+    """Облачная колонка -> локальная (номера с 0) по тексту заголовка, одноименные — по порядку.
+    Незнакомые заголовки получают новые колонки после последней локальной.
+    Возвращает (соответствие, [(номер новой колонки, заголовок)])."""
+    free = {}
+    for j, header in enumerate(local_header): free.setdefault(_cell_str(header), []).append(j)
+    mapping, added = {}, []
+    for k, header in enumerate(remote_header):
+        same = free.get(_cell_str(header))
+        if same:
+            mapping[k] = same.pop(0)
+            continue
+        mapping[k] = len(local_header) + len(added)
+        added.append((mapping[k], header))
+    return mapping, added
+
+def _read_all_sync(path: str) -> list:
+    wb = openpyxl.load_workbook(path, read_only=True)
+    try:
+        return [list(r) for r in wb.active.iter_rows(values_only=True)]
+    finally:
+        wb.close()
+
+def _download_remote_sync(paths: tuple) -> str:
+    """Скачивает облачный файл рядом с локальным (в потоке), возвращает имя временного файла."""
+    filename, remote_dir, _ = paths
+    tmp_name = f"{os.path.splitext(filename)[0]}.remote.xlsx"
+    y.download(_remote_path(filename, remote_dir), tmp_name)
+    return tmp_name
+
+def _merge_rows(filename: str, remote_rows: list, base_rows: list):
+    """Вливает строки облачного файла в локальный, колонки сопоставляются по заголовкам.
+    Возвращает [(номер строки данных, первые 7 колонок)] измененных строк или None, если строки удалялись."""
+    remote_header = list(remote_rows[0])
+    remote_layout = _layout(remote_header)
+    base_layout = _layout(base_rows[0]) if base_rows else _layout(None)
+    base_keys = {_row_key(r, base_layout) for r in base_rows[1:] if _has_user(r, base_layout)}
+    # Пустые колонки без заголовка (хвост листа) не переносим
+    remote_cols = [k for k, header in enumerate(remote_header)
+                   if _cell_str(header) or any(k < len(r) and r[k] is not None for r in remote_rows[1:])]
+
+    wb = openpyxl.load_workbook(filename)
+    ws = wb.active
+    mapping, added = _map_columns([remote_header[k] for k in remote_cols], [cell.value for cell in ws[1]])
+    mapping = {k: mapping[n] for n, k in enumerate(remote_cols)}
+    # Новые колонки координаторов (например, "Оплачено") — после последней локальной
+    for j, header in added: ws.cell(row=1, column=j + 1, value=header)
+
+    local_layout = _layout([cell.value for cell in ws[1]])
+    local_pos = {}
+    for i, row in enumerate(ws.iter_rows(min_row=2, values_only=True)):
+        if _has_user(row, local_layout): local_pos[_row_key(row, local_layout)] = i
+    data_rows = ws.max_row - 1
+
+    def first_columns(excel_row): return tuple(ws.cell(row=excel_row, column=c).value for c in range(1, 8))
+
+    changes = []
+    remote_keys = set()
+    for remote_row in remote_rows[1:]:
+        if not remote_row or all(v is None for v in remote_row): continue
+        key = _row_key(remote_row, remote_layout)
+        remote_keys.add(key)
+        values = {mapping[k]: remote_row[k] for k in remote_cols if k < len(remote_row)}
+        i = local_pos.get(key)
+        if i is None:
+            new_row = [None] * (max(values) + 1)
+            for j, value in values.items(): new_row[j] = value
+            ws.append(new_row)
+            changes.append((data_rows, first_columns(ws.max_row)))
+            data_rows += 1
+            continue
+        excel_row = i + 2
+        if all(_cell_str(ws.cell(row=excel_row, column=j + 1).value) == _cell_str(v) for j, v in values.items()): continue
+        for j, value in values.items(): ws.cell(row=excel_row, column=j + 1, value=value)
+        changes.append((i, first_columns(excel_row)))
+
+    # Удаленной считается только строка, которая уже была в облаке; новые заявки бота остаются
+    deleted = sorted((i for key, i in local_pos.items() if key in base_keys and key not in remote_keys), reverse=True)
+    for i in deleted: ws.delete_rows(i + 2)
+
+    if changes or added or deleted:
+        tmp_name = f"{filename}.tmp"
+        wb.save(tmp_name)
+        os.replace(tmp_name, filename)
+    return None if deleted else changes
+
+def _merge_remote_sync(paths: tuple, tmp_name: str):
+    """Вливает скачанный облачный файл (tmp_name) в локальный — правки координаторов.
+    Правило конфликтов: ячейки строк, которые есть в обоих файлах, берутся из облака
+    (их правят люди); строки, которых в облаке еще нет (новые заявки бота), остаются;
+    строки, добавленные в облаке вручную, дописываются в конец; строки, которые были
+    в прошлой синхронизированной версии (база), но удалены в облаке, удаляются и локально.
+    Колонки сопоставляются по заголовкам; локальный порядок колонок сохраняется.
+    Скачанный файл становится новой базой только после того, как локальный файл сохранен.
+    Возвращает (md5 облачного файла, [(номер строки данных, строка)] измененных строк
+    или None, если строки удалялись или файл взят из облака целиком)."""
+    filename = paths[0]
+    try:
+        remote_md5 = segments.file_md5(tmp_name)
+        remote_rows = _read_all_sync(tmp_name)
+        base_name = _base_path(filename)
+        base_rows = _read_all_sync(base_name) if os.path.exists(base_name) else []
+        if not os.path.exists(filename):
+            # Локального файла нет (новая установка, файл удален): берем облачный целиком,
+            # иначе следующая выгрузка книги из одной заявки затрет историю в облаке
+            shutil.copyfile(tmp_name, f"{filename}.tmp")
+            os.replace(f"{filename}.tmp", filename)
+            changes = None
+        elif remote_rows:
+            changes = _merge_rows(filename, remote_rows, base_rows)
+        else:
+            changes = []
+    except BaseException:
+        # База остается прежней: при повторе удаления в облаке снова будут найдены
+        if os.path.exists(tmp_name): os.remove(tmp_name)
+        raise
+    os.replace(tmp_name, base_name)
+    return remote_md5, changes
+
+def _mtime(filename: str):
+    return os.path.getmtime(filename) if os.path.exists(filename) else None
+
+def _size(filename: str) -> int:
+    return os.path.getsize(filename) if os.path.exists(filename) else 0
+
+def _append_edits(path: str, changes: list):
+    with open(path, "a", encoding="utf-8") as f:
+        for row_id, row in changes:
+            f.write(json.dumps([row_id, list(row)], ensure_ascii=False, default=str) + "\n")
+
+def _read_edits(path: str, start: int, end: int) -> list:
+    with open(path, "rb") as f:
+        f.seek(start)
+        data = f.read(end - start)
+    return [json.loads(line) for line in data.decode("utf-8").splitlines() if line]
+
+class SubscriptionStore:
+    """Хранилище заявок одного бота: локальный xlsx, папка в облаке, индекс /find.
+    Процесс пула и клиент Яндекс.Диска общие для всех хранилищ процесса."""
+
+    def __init__(self, filename: str, remote_dir: str, segments_dir: str, name: str = "default"):
+        self.name = name
+        self.filename = filename
+        self.paths = (filename, remote_dir, segments_dir)
+        self.file_lock = asyncio.Lock()
+
+        # В режиме нескольких воркеров строки уходят единственному писателю (процессу-приемнику),
+        # а результат записи возвращается в ack_queue этого воркера: {ключ: future}
+        self.writer_queue = None
+        self.ack_queue = None
+        self.worker_index = None
+        self._acks = {}
+        self._ack_seq = 0
+
+        # Строки, ждущие записи: [(row, future)]. Пока идет запись, новые копятся и уходят одной пачкой
+        self._pending = []
+        self._flusher = None
+
+        # Индекс для /find: строится при первом поиске, дальше дополняется на каждой заявке
+        self.index = SubscriberIndex()
+        self._index_lock = asyncio.Lock()
+
+        # Режим воркеров: приемник пишет правки строк из облака в журнал (publish_edits),
+        # воркеры применяют его к своим индексам — новые строки они дочитывают из xlsx сами
+        self.publish_edits = False
+        self.edits_file = f"{os.path.splitext(filename)[0]}.edits.jsonl"
+        self._edits_pos = 0
+
+        # md5 версии файла, которая точно лежит в облаке (мы ее выгрузили или скачали).
+        # Отличие облачного md5 от него — значит, координаторы правили файл.
+        # Сама версия хранится копией (база), поэтому md5 переживает перезапуск
+        base = _base_path(filename)
+        self._synced_md5 = segments.file_md5(base) if os.path.exists(base) else None
+
+    def _set_synced_md5(self, md5):
+        if md5: self._synced_md5 = md5
+
+    async def _apply_to_index(self, mtime_before, changes):
+        """changes: [(номер строки данных, строка)]. Индекс правится на месте, без перестройки.
+        None — строки удалялись, номера сдвинулись: индекс перестроится при следующем поиске."""
+        async with self._index_lock:
+            if changes is None:
+                self.index = SubscriberIndex()
+                return
+            # Индекс был актуален до записи — правим его без перечитывания файла
+            if self.index.mtime is not None and self.index.mtime == mtime_before:
+                for row_id, row in changes: self.index.set_row(row_id, row)
+                self.index.mtime = _mtime(self.filename)
+
+    async def _merge_if_remote_changed(self):
+        """Вызывается под file_lock перед выгрузкой полной книги и из sync-down: если облачный файл
+        изменился с последней синхронизации, сначала вливаем правки координаторов, иначе выгрузка их затрет."""
+        if not y: return
+        filename, remote_dir, _ = self.paths
+        try:
+            meta = await asyncio.to_thread(y.get_meta, _remote_path(filename, remote_dir), fields=["md5", "modified"])
+        except yadisk.exceptions.PathNotFoundError:
+            return
+        if meta.md5 == self._synced_md5: return
+
+        mtime_before = _mtime(filename)
+        tmp_name = await asyncio.to_thread(_download_remote_sync, self.paths)
+        try:
+            remote_md5, changes = await run_in_pool(_merge_remote_sync, self.paths, tmp_name)
+        except Exception as e:
+            raise LocalFileError(f"Правки из облака не влиты в {filename}: {e}") from e
+        self._set_synced_md5(remote_md5)
+        if changes != []:
+            await self._apply_to_index(mtime_before, changes)
+            # Воркерам: правки строк или [-1] — перестроить индекс целиком
+            if self.publish_edits: _append_edits(self.edits_file, changes if changes is not None else [(-1, [])])
+        logger.info(f"Правки из облака {filename} ({meta.modified}): " + (
+            "строки удалены, индекс перестроится" if changes is None else f"изменено строк {len(changes)}"))
+
+    async def _save_rows(self, rows: list):
+        # Устойчивый ID заявки — последним элементом строки
+        rows = [list(row) + [new_row_id()] if len(row) <= len(HEADERS) else row for row in rows]
+        # Пока Яндекс.Диск недоступен (или не дослана прошлая выгрузка) — пишем только локально
+        upload = cloud_breaker.closed and not outbox.has("upload", self.name)
+        async with self.file_lock:
+            if upload and SYNC_MODE != "segments":
+                # Полная книга перезапишет облачную: сначала забираем правки координаторов
+                try:
+                    await self._merge_if_remote_changed()
+                except LocalFileError as e:
+                    # Без слияния выгружать нельзя (затрем правки), но Яндекс.Диск исправен
+                    logger.warning(f"Выгрузка {self.filename} отложена: {e}")
+                    upload = False
+                except Exception as e:
+                    logger.warning(f"Выгрузка {self.filename} отложена: {e}")
+                    cloud_breaker.failure(e)
+                    upload = False
+            mtime_before = _mtime(self.filename)
+            try:
+                changed = await run_in_pool(_save_to_excel_sync, self.paths, rows, HEADERS)
+                if upload:
+                    md5 = await asyncio.to_thread(_push_sync, self.paths, changed)
+                    cloud_breaker.success()
+                    self._set_synced_md5(md5)
+            except CloudUploadError as e:
+                # Строки уже в локальном файле, выгрузку дошлет outbox — заявка принята
+                logger.warning(f"Выгрузка {self.filename} отложена: {e}")
+                cloud_breaker.failure(e)
+                upload = False
+            finally:
+                # Локально строки записаны, даже если упала выгрузка в облако
+                if _mtime(self.filename) != mtime_before:
+                    start = len(self.index)
+                    await self._apply_to_index(mtime_before, [(start + i, row) for i, row in enumerate(rows)])
+        if not upload and y: outbox.put("upload", self.name, unique=True)
+
+    async def push_to_cloud(self):
+        """Задание outbox: досылает все, что записано локально, пока облако было недоступно."""
+        # Дешевая проверка без блокировки файла и без процесса пула: пока Яндекс лежит, заявки не ждут
+        if y and not await asyncio.to_thread(y.check_token): raise CloudUploadError("Invalid Token")
+        async with self.file_lock:
+            if SYNC_MODE != "segments": await self._merge_if_remote_changed()
+            md5 = await asyncio.to_thread(_push_sync, self.paths)
+            self._set_synced_md5(md5)
+
+    async def _flush_pending(self):
+        while self._pending:
+            batch = self._pending[:]
+            self._pending.clear()
+            try:
+                await self._save_rows([row for row, _ in batch])
+                for _, fut in batch:
+                    if not fut.done(): fut.set_result(None)
+            except Exception as e:
+                for _, fut in batch:
+                    if not fut.done(): fut.set_exception(e)
+
+    async def add_subscription(self, user_data: list):
+        if self.writer_queue is not None:
+            # pid в ключе: перезапущенный воркер не примет подтверждение, адресованное прежнему
+            self._ack_seq += 1
+            key = (os.getpid(), self._ack_seq)
+            fut = self._acks[key] = asyncio.get_running_loop().create_future()
+            self.writer_queue.put((self.worker_index, key, user_data))
+            try:
+                await asyncio.wait_for(fut, WRITE_ACK_TIMEOUT)
+            except asyncio.TimeoutError:
+                raise IOError("Запись не подтверждена, попробуйте еще раз.")
+            finally:
+                self._acks.pop(key, None)
+            return
+        fut = asyncio.get_running_loop().create_future()
+        self._pending.append((user_data, fut))
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.create_task(self._flush_pending())
+        await fut
+
+    async def run_writer(self, queue, acks: list):
+        """Цикл писателя: сохраняет строки от всех воркеров пачками, выгрузка в облако — здесь же.
+        Каждому воркеру уходит (ключ, None) или (ключ, текст ошибки) — пользователь видит результат записи."""
+        while True:
+            items = [await asyncio.to_thread(queue.get)]
+            # Забираем все, что успело накопиться, — одна загрузка книги на пачку
+            while True:
+                try: items.append(queue.get_nowait())
+                except Exception: break
+            stop = None in items
+            items = [i for i in items if i is not None]
+            if items:
+                error = None
+                try:
+                    await self._save_rows([row for _, _, row in items])
+                except Exception as e:
+                    error = str(e)
+                    logger.error(f"Ошибка записи {len(items)} заявок: {e}")
+                for index, key, _ in items: acks[index].put((key, error))
+            if stop: break
+
+    async def run_acks(self):
+        """Воркер: разбирает подтверждения записи от писателя."""
+        while True:
+            item = await asyncio.to_thread(self.ack_queue.get)
+            if item is None: break
+            key, error = item
+            fut = self._acks.get(key)
+            if fut is None or fut.done(): continue
+            if error: fut.set_exception(IOError(error))
+            else: fut.set_result(None)
+
+    async def find_last_subscription(self, user_id: int):
+        return await run_in_pool(_find_last_subscription_sync, self.filename, user_id)
+
+    async def count_subscriptions(self):
+        return await run_in_pool(_count_rows_sync, self.filename)
+
+    async def refresh_index(self):
+        """Догружает в индекс только новые строки, если файл менялся (например, другим воркером),
+        и применяет правки строк из журнала приемника."""
+        # Размер журнала — до чтения файла: строки, на которые ссылаются эти правки, уже записаны
+        edits_size = _size(self.edits_file)
+        mtime = _mtime(self.filename)
+        if (mtime is None or mtime == self.index.mtime) and edits_size == self._edits_pos: return
+        async with self._index_lock:
+            if mtime is not None and mtime != self.index.mtime:
+                rows = await run_in_pool(_read_rows_sync, self.filename, len(self.index))
+                for row in rows: self.index.add(row)
+                self.index.mtime = mtime
+            if edits_size != self._edits_pos:
+                start = self._edits_pos if edits_size > self._edits_pos else 0
+                edits = _read_edits(self.edits_file, start, edits_size)
+                self._edits_pos = edits_size
+                if any(row_id < 0 for row_id, _ in edits):
+                    # В облаке удаляли строки, номера сдвинулись — перечитываем файл целиком
+                    self.index = SubscriberIndex()
+                    for row in await run_in_pool(_read_rows_sync, self.filename, 0): self.index.add(row)
+                    self.index.mtime = mtime
+                    return
+                for row_id, row in edits:
+                    if row_id <= len(self.index): self.index.set_row(row_id, row)
+
+    async def search_subscribers(self, query: str, limit: int = 10) -> list:
+        await self.refresh_index()
+        return self.index.search(query, limit)
+
+    async def run_consolidation(self):
+        """Фоновая задача режима segments: раз в CONSOLIDATE_HOURS выгружает полный xlsx."""
+        while True:
+            await asyncio.sleep(CONSOLIDATE_HOURS * 3600)
+            # ready(): после BREAKER_RESET_SECONDS эта выгрузка сама делает пробную попытку
+            if not cloud_breaker.ready():
+                logger.warning(f"Плановая выгрузка {self.filename} пропущена: Яндекс.Диск недоступен")
+                continue
+            try:
+                async with self.file_lock:
+                    await self._merge_if_remote_changed()
+                    md5 = await asyncio.to_thread(_consolidate_sync, self.paths)
+                    self._set_synced_md5(md5)
+                cloud_breaker.success()
+            except LocalFileError as e:
+                logger.warning(f"Плановая выгрузка {self.filename} отложена: {e}")
+            except Exception as e:
+                cloud_breaker.failure(e)
+                logger.error(f"Ошибка плановой выгрузки {self.filename}: {e}")
+
+    async def pull_remote_edits(self):
+        """Один дешевый запрос метаданных; скачивание и разбор — только если файл в облаке изменился."""
+        if not y: return
+        filename, remote_dir, _ = self.paths
+        try:
+            meta = await asyncio.to_thread(y.get_meta, _remote_path(filename, remote_dir), fields=["md5", "modified"])
+        except yadisk.exceptions.PathNotFoundError:
+            return
+        if meta.md5 == self._synced_md5: return
+        # Файл изменился — под блокировкой проверяем еще раз и вливаем
+        async with self.file_lock:
+            await self._merge_if_remote_changed()
+
+    async def run_sync_down(self):
+        """Фоновая задача: раз в SYNC_DOWN_MINUTES забирает правки координаторов с Яндекс.Диска."""
+        while True:
+            # Пока облако недоступно, не тратим запросы; раз в BREAKER_RESET_SECONDS — пробная попытка
+            # (разбор outbox пробует только при непустой очереди, а она может быть пуста)
+            if cloud_breaker.ready():
+                try:
+                    await self.pull_remote_edits()
+                    cloud_breaker.success()
+                except LocalFileError as e:
+                    logger.warning(f"Синхронизация из облака {self.filename} отложена: {e}")
+                except Exception as e:
+                    cloud_breaker.failure(e)
+                    logger.error(f"Ошибка синхронизации из облака {self.filename}: {e}")
+            await asyncio.sleep(SYNC_DOWN_MINUTES * 60)
@@ -0,0 +1,48 @@
+# services/storage.py
+# FSM-хранилище в SQLite: общее для нескольких процессов-воркеров (WORKERS > 1).
+import json
+import sqlite3
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StorageKey
+
+def connect(path: str) -> sqlite3.Connection:
+    """Соединение с общей базой. WAL позволяет читать, пока другой процесс пишет."""
+    conn = sqlite3.connect(path, timeout=10, isolation_level=None, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+class SQLiteStorage(BaseStorage):
+    """Запросы к локальному файлу занимают доли миллисекунды, поэтому выполняются прямо в цикле."""
+
+    def __init__(self, path: str):
+        self.conn = connect(path)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS fsm (key TEXT PRIMARY KEY, state TEXT, data TEXT)")
+
+    @staticmethod
+    def _key(key: StorageKey) -> str:
+        return f"{key.bot_id}:{key.chat_id}:{key.user_id}:{key.thread_id}:{key.destiny}"
+
+    async def set_state(self, key: StorageKey, state=None) -> None:
+        value = state.state if isinstance(state, State) else state
+        self.conn.execute(
+            "INSERT INTO fsm (key, state) VALUES (?, ?) ON CONFLICT(key) DO UPDATE SET state = excluded.state",
+            (self._key(key), value)
+        )
+
+    async def get_state(self, key: StorageKey):
+        row = self.conn.execute("SELECT state FROM fsm WHERE key = ?", (self._key(key),)).fetchone()
+        return row[0] if row else None
+
+    async def set_data(self, key: StorageKey, data) -> None:
+        self.conn.execute(
+            "INSERT INTO fsm (key, data) VALUES (?, ?) ON CONFLICT(key) DO UPDATE SET data = excluded.data",
+            (self._key(key), json.dumps(data, ensure_ascii=False))
+        )
+
+    async def get_data(self, key: StorageKey) -> dict:
+        row = self.conn.execute("SELECT data FROM fsm WHERE key = ?", (self._key(key),)).fetchone()
+        return json.loads(row[0]) if row and row[0] else {}
+
+    async def close(self) -> None:
+        self.conn.close()
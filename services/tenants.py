@@ -0,0 +1,70 @@
+# services/tenants.py
+# Несколько ботов в одном процессе: у каждого свой fsm_config, группа координаторов,
+# файл заявок и папка в облаке. Цикл событий, HTTP-сессия, процесс пула и клиент
+# Яндекс.Диска — общие.
+import os
+import logging
+import yaml
+from aiogram import BaseMiddleware
+
+from config import BOT_TOKEN, ADMIN_GROUP_ID, EXCEL_FILE, YANDEX_DIR, SEGMENTS_DIR, TENANTS_FILE
+from services.context import set_current_tenant, reset_current_tenant
+from services.sheets import SubscriptionStore
+from services.breaker import CircuitBreaker
+
+logger = logging.getLogger(__name__)
+
+class Tenant:
+    def __init__(self, name: str, bot_token: str, fsm_config_path: str, admin_group_id,
+                 excel_file: str, yandex_dir: str, segments_dir: str):
+        from handlers.fsm_engine import load_fsm_config, build_global_context
+        self.name = name
+        self.bot_token = bot_token
+        self.admin_group_id = admin_group_id
+        self.fsm_config = load_fsm_config(fsm_config_path)
+        self.global_context = build_global_context(self.fsm_config)
+        self.store = SubscriptionStore(excel_file, yandex_dir, segments_dir, name)
+        # Группа координаторов может быть недоступна только для этого бота (например, его удалили)
+        self.admin_breaker = CircuitBreaker(f"Группа координаторов [{name}]")
+        # Bot создается в main.py (или в воркере); нужен для досылки сообщений из outbox
+        self.bot = None
+
+def load_tenants() -> list:
+    """Без tenants.yaml — один бот из .env, как раньше."""
+    if not os.path.exists(TENANTS_FILE):
+        return [Tenant("default", BOT_TOKEN, "fsm_config.yaml", ADMIN_GROUP_ID, EXCEL_FILE, YANDEX_DIR, SEGMENTS_DIR)]
+
+    with open(TENANTS_FILE, encoding="utf-8") as f:
+        items = (yaml.safe_load(f) or {}).get("tenants", [])
+    tenants = []
+    for item in items:
+        name = item["name"]
+        group_id = item.get("admin_group_id")
+        tenants.append(Tenant(
+            name=name,
+            bot_token=item["bot_token"],
+            fsm_config_path=item.get("fsm_config", f"fsm_config_{name}.yaml"),
+            admin_group_id=int(group_id) if group_id else None,
+            excel_file=item.get("excel_file", f"subscriptions_{name}.xlsx"),
+            yandex_dir=item.get("yandex_dir", f"{YANDEX_DIR}/{name}"),
+            segments_dir=item.get("segments_dir", os.path.join(SEGMENTS_DIR, name)),
+        ))
+    return tenants
+
+class TenantMiddleware(BaseMiddleware):
+    """Определяет тенанта по боту, принявшему апдейт: кладет его в data['tenant'] и в контекст."""
+
+    def __init__(self, tenants_by_bot_id: dict):
+        self.tenants = tenants_by_bot_id
+
+    async def __call__(self, handler, event, data):
+        tenant = self.tenants.get(data["bot"].id)
+        if tenant is None:
+            logger.error(f"Апдейт от неизвестного бота {data['bot'].id}")
+            return None
+        data["tenant"] = tenant
+        token = set_current_tenant(tenant)
+        try:
+            return await handler(event, data)
+        finally:
+            reset_current_tenant(token)
@@ -1,12 +1,56 @@
 # services/thread_manager.py
+from collections import OrderedDict
+from services.context import tenant_name
 
-# Словарь в памяти: {user_id: message_id_в_группе}
+# Сколько последних сообщений группы помним (ответы на более старые ищутся по #id в тексте)
+OWNERS_LIMIT = 20000
+
+# Словарь в памяти: {(бот, user_id): message_id_в_группе}
 _threads = {}
 
+# Чьё это сообщение в группе: {(бот, message_id_в_группе): user_id}
+# Нужно для ответов на медиа и части альбома, где нет текста с #id
+_owners = OrderedDict()
+
+# В режиме нескольких воркеров карта хранится в общей SQLite-базе
+_db = None
+
+def use_sqlite(path: str):
+    """Переключает карту переписок на общую базу (вызывается в каждом воркере)."""
+    global _db
+    from services.storage import connect
+    _db = connect(path)
+    _db.execute("CREATE TABLE IF NOT EXISTS threads (tenant TEXT, user_id INTEGER, msg_id INTEGER, PRIMARY KEY (tenant, user_id))")
+    _db.execute("CREATE TABLE IF NOT EXISTS owners (tenant TEXT, msg_id INTEGER, user_id INTEGER, PRIMARY KEY (tenant, msg_id))")
+
 def set_last_msg_id(user_id: int, msg_id: int):
     """Запоминаем ID последнего сообщения в переписке (от юзера или админа)"""
-    _threads[user_id] = msg_id
+    if _db:
+        _db.execute("INSERT OR REPLACE INTO threads VALUES (?, ?, ?)", (tenant_name(), user_id, msg_id))
+        return
+    _threads[(tenant_name(), user_id)] = msg_id
 
 def get_last_msg_id(user_id: int):
     """Получаем ID, на который нужно ответить"""
-    return _threads.get(user_id)
\ No newline at end of file
+    if _db:
+        row = _db.execute("SELECT msg_id FROM threads WHERE tenant = ? AND user_id = ?", (tenant_name(), user_id)).fetchone()
+        return row[0] if row else None
+    return _threads.get((tenant_name(), user_id))
+
+def set_msg_owner(msg_id: int, user_id: int):
+    if _db:
+        _db.execute("INSERT OR REPLACE INTO owners VALUES (?, ?, ?)", (tenant_name(), msg_id, user_id))
+        # id сообщений в группе растут, поэтому старые отсекаются по диапазону (раз в 100 записей)
+        if msg_id % 100 == 0:
+            _db.execute("DELETE FROM owners WHERE tenant = ? AND msg_id < ?", (tenant_name(), msg_id - OWNERS_LIMIT))
+        return
+    key = (tenant_name(), msg_id)
+    _owners[key] = user_id
+    _owners.move_to_end(key)
+    if len(_owners) > OWNERS_LIMIT: _owners.popitem(last=False)
+
+def get_msg_owner(msg_id: int):
+    if _db:
+        row = _db.execute("SELECT user_id FROM owners WHERE tenant = ? AND msg_id = ?", (tenant_name(), msg_id)).fetchone()
+        return row[0] if row else None
+    return _owners.get((tenant_name(), msg_id))
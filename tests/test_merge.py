@@ -0,0 +1,106 @@
+# Слияние облачного subscriptions.xlsx с локальным (services/sheets.py, _merge_remote_sync).
+# Запуск из корня проекта: python -m unittest
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+os.environ.setdefault("BOT_TOKEN", "1:test")
+os.environ.setdefault("YANDEX_TOKEN", "test")
+
+import openpyxl
+from openpyxl import Workbook
+
+from services import sheets
+
+HEADERS = sheets.HEADERS + [sheets.ROW_ID_HEADER]
+
+def row(date, uid, name, row_id):
+    return [date, uid, "@u", "Эл", name, None, "+7", None, "Да", row_id]
+
+def save(path, rows):
+    wb = Workbook()
+    for r in rows: wb.active.append(r)
+    wb.save(path)
+
+def load(path):
+    return [list(r) for r in openpyxl.load_workbook(path).active.iter_rows(values_only=True)]
+
+class MergeTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.dir, "subscriptions.xlsx")
+        self.paths = (self.filename, "/remote", os.path.join(self.dir, "segments"))
+        self.remote = os.path.join(self.dir, "subscriptions.remote.xlsx")
+        self.base = sheets._base_path(self.filename)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def synced(self, rows):
+        """Локальный файл и база совпадают — как после выгрузки."""
+        save(self.filename, rows)
+        shutil.copyfile(self.filename, self.base)
+
+    def test_inserted_remote_column_is_mapped_by_header(self):
+        first, second = row("2026-10-19 10:00", 5, "Первая", "a1"), row("2026-10-19 10:00", 5, "Вторая", "b2")
+        self.synced([HEADERS, first, second])
+        # Координатор вставил "Оплачено" после ФИО и поправил телефон второй строки
+        remote_headers = HEADERS[:5] + ["Оплачено"] + HEADERS[5:]
+        remote_second = second[:5] + ["да"] + second[5:]
+        remote_second[remote_headers.index("Телефон")] = "+7 999"
+        save(self.remote, [remote_headers, first[:5] + [None] + first[5:], remote_second])
+
+        md5, changes = sheets._merge_remote_sync(self.paths, self.remote)
+
+        local = load(self.filename)
+        self.assertEqual(local[0], HEADERS + ["Оплачено"])
+        self.assertEqual(local[0].count(sheets.ROW_ID_HEADER), 1)
+        self.assertEqual(local[1], first + [None])
+        self.assertEqual(local[2], second[:6] + ["+7 999"] + second[7:] + ["да"])
+        self.assertEqual(changes, [(1, tuple(local[2][:7]))])
+        # Скачанный файл стал базой
+        self.assertEqual(md5, sheets.segments.file_md5(self.base))
+        self.assertFalse(os.path.exists(self.remote))
+
+    def test_remote_deletion_is_honoured_and_new_local_rows_kept(self):
+        first, second = row("2026-10-19 10:00", 5, "Первая", "a1"), row("2026-10-19 10:00", 5, "Вторая", "b2")
+        self.synced([HEADERS, first, second])
+        new = row("2026-10-19 10:05", 6, "Третья", "c3")
+        save(self.filename, [HEADERS, first, second, new])
+        save(self.remote, [HEADERS, second])
+
+        _, changes = sheets._merge_remote_sync(self.paths, self.remote)
+
+        self.assertIsNone(changes)
+        self.assertEqual(load(self.filename)[1:], [second, new])
+
+    def test_missing_local_file_is_taken_from_cloud(self):
+        rows = [HEADERS, row("2026-10-19 10:00", 5, "Первая", "a1")]
+        save(self.remote, rows)
+
+        _, changes = sheets._merge_remote_sync(self.paths, self.remote)
+
+        self.assertIsNone(changes)
+        self.assertEqual(load(self.filename), rows)
+        self.assertEqual(load(self.base), rows)
+
+    def test_failed_local_save_keeps_base(self):
+        first, second = row("2026-10-19 10:00", 5, "Первая", "a1"), row("2026-10-19 10:00", 5, "Вторая", "b2")
+        self.synced([HEADERS, first, second])
+        save(self.remote, [HEADERS, second])
+
+        with mock.patch.object(openpyxl.Workbook, "save", side_effect=PermissionError("открыт в Excel")):
+            with self.assertRaises(PermissionError):
+                sheets._merge_remote_sync(self.paths, self.remote)
+
+        # База прежняя: при повторе удаленная в облаке строка снова будет найдена
+        self.assertEqual(load(self.base)[1:], [first, second])
+        self.assertFalse(os.path.exists(self.remote))
+        save(self.remote, [HEADERS, second])
+        sheets._merge_remote_sync(self.paths, self.remote)
+        self.assertEqual(load(self.filename)[1:], [second])
+
+if __name__ == "__main__":
+    unittest.main()